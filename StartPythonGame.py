@@ -8,10 +8,38 @@ import random
 import sys
 import datetime
 import os
+import collections
+import numpy
+import argparse
+import time
+import copy
+import io
+import struct
+import zlib
+import threading
+import heapq
+import bisect
+import itertools
+import json
+import timeit
+import cProfile
 
 # game files
 import constants
 
+# (mode, count, unit) of a profile to capture from the first frame of every
+# game, set from the command line, see obj_Profiler.start
+PROFILE_ON_START = None
+
+# False to never load or play sound or music, set from the command line
+AUDIO_ENABLED = True
+
+# the game's assets, kept when game_initialize runs again so nothing that is
+# loaded already loads twice
+ASSETS = None
+
+# the game being played, None until game_new or game_load
+GAME = None
 
 
 #  ____  _                   _
@@ -20,22 +48,170 @@ import constants
 #  ___) | |_| |  | |_| | (__| |_
 # |____/ \__|_|   \__,_|\___|\__|
 
-class struc_Tile:
+class struc_Tile(object):
 
-    '''This class functions as a struct that tracks the data for each tile
-    within a map.
+    '''This class functions as a view onto a single tile of a struc_TileGrid.
+
+    The tile data itself lives in the arrays of the grid, this view lets code
+    that works one tile at a time keep using map[x][y].block_path.
 
     Attributes:
-        block_path (arg, bool) : True if tile prevents actors from moving
+        grid (arg, struc_TileGrid): the grid this tile belongs to.
+        x (arg, int): x coord of the tile within the grid.
+        y (arg, int): y coord of the tile within the grid.
+        block_path (bool) : True if tile prevents actors from moving
             through it under normal circumstances.
         explored (bool): Initializes to FALSE, set to true if player
             has seen it before.
 
     '''
 
-    def __init__(self, block_path):
-        self.block_path = block_path
-        self.explored = False
+    __slots__ = ('grid', 'x', 'y')
+
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    def __setstate__(self, state):
+
+        # saves from when a map was a list of tile columns pickle every tile,
+        # each gets a grid of its own until map_from_tiles joins them up
+        self.grid = struc_TileGrid(1, 1, state['block_path'])
+        self.grid.explored[0, 0] = state['explored']
+        self.x = self.y = 0
+
+    @property
+    def block_path(self):
+        return bool(self.grid.block_path[self.x, self.y])
+
+    @block_path.setter
+    def block_path(self, value):
+        map_tile_set_block(self.grid, self.x, self.y, value)
+
+    @property
+    def explored(self):
+        return bool(self.grid.explored[self.x, self.y])
+
+    @explored.setter
+    def explored(self, value):
+        self.grid.explored[self.x, self.y] = value
+
+class struc_TileColumn(object):
+
+    '''A single column of a struc_TileGrid, returned by grid[x].'''
+
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        return struc_Tile(self.grid, self.x, y)
+
+class struc_TileGrid(object):
+
+    '''This class functions as a struct that tracks the data for every tile
+    within a map.
+
+    Each tile attribute is kept in its own NumPy array indexed [x, y], so a
+    whole map (or a slice of it) can be read or written at once.  Indexing the
+    grid as grid[x][y] returns a struc_Tile for code that works tile by tile.
+
+    Attributes:
+        width (arg, int): width of the map in tiles.
+        height (arg, int): height of the map in tiles.
+        block_path (numpy.ndarray): True where the tile prevents actors from
+            moving through it under normal circumstances.  Every tile starts
+            with the value of the block_path arg.  Once the map is made, tiles
+            are changed with map_tile_set_block.
+        explored (numpy.ndarray): Initializes to FALSE, set to true where the
+            player has seen the tile before.
+        tile_kind (numpy.ndarray): type of each tile, reserved for tile sets
+            beyond wall and floor.
+        light (numpy.ndarray): light level of each tile, reserved for light
+            sources.
+        layer (obj_MapLayer): pre-rendered terrain of the map, created the
+            first time the map is drawn.
+        fov_map (libtcod map): the map's FOV map, kept with the map so going
+            back to a level does not rebuild it.  See map_load_fov.
+        pathfinder (libtcod path): A* pathfinder over fov_map, created the
+            first time map_find_path is called.
+        version (int): incremented by map_tile_set_block every time a tile
+            changes.
+
+    '''
+
+    def __init__(self, width, height, block_path = True):
+
+        self.width = width
+        self.height = height
+
+        self.block_path = numpy.full((width, height), block_path, dtype = bool)
+        self.explored = numpy.zeros((width, height), dtype = bool)
+        self.tile_kind = numpy.zeros((width, height), dtype = numpy.uint8)
+        self.light = numpy.zeros((width, height), dtype = numpy.uint8)
+
+        self.layer = None
+        self.fov_map = None
+        self.pathfinder = None
+        self.version = 0
+
+    def __getstate__(self):
+
+        # surfaces and libtcod maps can't be pickled, both are rebuilt after
+        # loading
+        state = self.__dict__.copy()
+        state['layer'] = None
+        state['fov_map'] = None
+        state['pathfinder'] = None
+
+        return state
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x):
+        return struc_TileColumn(self, x)
+
+class struc_SaveRecord(object):
+
+    '''This class functions as a struct that locates one record of a save file.
+
+    Levels the player is not on are left in the save file when a game is
+    loaded, a struc_SaveRecord stands in for each of them in maps_previous and
+    maps_next until the player goes back to that level.
+
+    Attributes:
+        file_name (arg, str): the save file.
+        offset (arg, int): position of the record within the file.
+        length (arg, int): size of the record in bytes, compressed.
+
+    '''
+
+    def __init__(self, file_name, offset, length):
+
+        self.file_name = file_name
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+
+        '''Returns the record as stored, still compressed.'''
+
+        with open(self.file_name, 'rb') as file:
+            file.seek(self.offset)
+            return file.read(self.length)
+
+    def load(self):
+
+        '''Returns the object stored in the record.'''
+
+        return game_save_unpack(self.read())
 
 class struc_Preferences:
 
@@ -52,7 +228,7 @@ class struc_Preferences:
 #   \___/|_.__// |\___|\___|\__|___/
 #           |__/
 
-class obj_Actor:
+class obj_Actor(object):
 
     '''The actor object represents every entity in the game.
 
@@ -94,10 +270,15 @@ class obj_Actor:
                  stairs = None,
                  exitportal = None):
 
+        # the obj_ObjectIndex this actor is filed in, if any
+        self._index = None
+
+        # images of animation_key, see animation
+        self._animation = None
+
         self.x, self.y = x, y
         self.name_object = name_object
         self.animation_key = animation_key
-        self.animation = ASSETS.animation_dict[self.animation_key]
         self.depth = depth
         self.state = state
 
@@ -135,14 +316,73 @@ class obj_Actor:
         if self.exitportal:
             self.exitportal.owner = self
 
-        ## PRIVATE ##
-        # speed -> frames conversion
-        self._flickerspeed = self.animation_speed / len(self.animation)
-        # timer for deciding when to flip the image
-        self._flickertimer = 0.0
-        # currently viewed sprite
-        self._spriteimage = 0
 
+    def __getstate__(self):
+
+        # the index belongs to the running level, it is rebuilt after loading
+        state = self.__dict__.copy()
+        state['_index'] = None
+        state['_animation'] = None
+
+        return state
+
+    def __setstate__(self, state):
+
+        # actors saved before x, y and depth were properties
+        for name in ('x', 'y', 'depth'):
+            if name in state:
+                state['_' + name] = state.pop(name)
+
+        state.setdefault('_index', None)
+
+        # and before the animation was looked up on first use
+        state.pop('animation', None)
+        state['_animation'] = None
+
+        self.__dict__.update(state)
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        if self._index:
+            self._index.move(self, value, self._y)
+
+        self._x = value
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        if self._index:
+            self._index.move(self, self._x, value)
+
+        self._y = value
+
+    @property
+    def animation(self):
+
+        # looked up the first time the actor is drawn, so games that are
+        # never drawn never load the sprites
+        if self._animation is None:
+            self._animation = ASSETS.animation_dict[self.animation_key]
+
+        return self._animation
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @depth.setter
+    def depth(self, value):
+        if self._index:
+            self._index.move_depth(self, value)
+
+        self._depth = value
 
     @property
     def display_name(self):
@@ -161,39 +401,35 @@ class obj_Actor:
         '''Draws the object to the screen.
 
         This function draws the object to the screen if it appears within the
-        PLAYER fov.  It also keeps track of the timing for animations to trigger
-        a transition to the next sprite in the animation.
+        PLAYER fov.  Drawing many objects is faster through draw_objects,
+        which hands all of them to pygame at once.
+
+        '''
+
+        if libtcod.map_is_in_fov(FOV_MAP, self.x, self.y):
+            SURFACE_MAP.blit(*self.sprite())
+
+    def sprite(self):
+
+        '''Picks the image to draw for this object.
+
+        Animated objects show whichever frame ANIMATION_CLOCK says their
+        animation is at.
+
+        Returns:
+            sprite (tuple): (image, position on SURFACE_MAP).
 
         '''
-        is_visible = libtcod.map_is_in_fov(FOV_MAP, self.x, self.y)
-
-        if is_visible:  # if visible, check to see if animation has > 1 image
-            if len(self.animation) == 1:
-                # if no, just blit the image
-                SURFACE_MAP.blit(self.animation[0], (self.x * constants.CELL_WIDTH,
-                                                      self.y * constants.CELL_HEIGHT))
-            # does this object have multiple sprites?
-            elif len(self.animation) > 1:
-                # only update animation timer if we can calculate how quickly
-                # the game is running.
-                if CLOCK.get_fps() > 0.0:
-                    self._flickertimer +=  1 / CLOCK.get_fps()
-
-                # if the timer has reached the speed
-                if self._flickertimer >= self._flickerspeed:
-                    self._flickertimer = 0.0  # reset the timer
-
-                    # is this sprite the final item in the list?
-                    if self._spriteimage >= len(self.animation) - 1:
-                        self._spriteimage = 0  # reset sprite to top of list
-
-                    else:
-                        self._spriteimage += 1  # advance to next sprite
-
-                #  draw the result
-                SURFACE_MAP.blit(self.animation[self._spriteimage],
-                                  (self.x * constants.CELL_WIDTH,
-                                   self.y * constants.CELL_HEIGHT))
+
+        position = (self.x * constants.CELL_WIDTH,
+                    self.y * constants.CELL_HEIGHT)
+
+        # does this object have multiple sprites?
+        if len(self.animation) > 1:
+            return (self.animation[ANIMATION_CLOCK.frame(self.animation_key,
+                self.animation_speed, len(self.animation))], position)
+
+        return (self.animation[0], position)
 
     def distance_to(self, other):
 
@@ -209,6 +445,10 @@ class obj_Actor:
 
         distance = math.sqrt(dx ** 2 + dy ** 2)
 
+        # sharing a tile gives no direction to move in
+        if distance == 0:
+            return
+
         dx = int(round(dx / distance))
         dy = int(round(dy / distance))
 
@@ -221,6 +461,10 @@ class obj_Actor:
 
         distance = math.sqrt(dx ** 2 + dy ** 2)
 
+        # sharing a tile gives no direction to move in
+        if distance == 0:
+            return
+
         dx = int(round(dx / distance))
         dy = int(round(dy / distance))
 
@@ -228,11 +472,12 @@ class obj_Actor:
 
     def animation_destroy(self):
 
-        self.animation = None
+        self._animation = None
 
     def animation_init(self):
 
-        self.animation = ASSETS.animation_dict[self.animation_key]
+        # looked up again from animation_key the next time it is drawn
+        self._animation = None
 
 class obj_Game:
 
@@ -245,15 +490,199 @@ class obj_Game:
     Attributes:
         current_map (obj): whatever map is currently loaded.
         current_objects (list): list of objects for the current map.
+        object_index (obj_ObjectIndex): spatial index of current_objects.
+        scheduler (obj_TurnScheduler): decides when the actors of
+            current_objects take their turns.
+        current_portals (list): the exit portals among current_objects.
+        time (int): game time, advanced by take_turns.
         message_history (list): list of messages that have been pushed
-            to the player over the course of a game.'''
+            to the player over the course of a game.
+        random (obj_RandomStreams): every random roll of the game comes from
+            these streams, and every level is generated from a seed derived
+            from their seed, see level_seed.
 
-    def __init__(self):
+    Args:
+        seed (int, optional): seed of the game, the same seed gives the same
+            dungeon.  Picked at random if not included.'''
+
+    # games saved before levels had seeds, turns were timed or actors were
+    # indexed
+    seed = 0
+    time = 0
+    random = None
+    object_index = None
+
+    def __init__(self, seed = None):
         self.current_objects = []
+        self.object_index = obj_ObjectIndex()
+        self.scheduler = obj_TurnScheduler()
+        self.current_portals = []
+        self.time = 0
         self.message_history = []
         self.maps_previous = []
         self.maps_next = []
-        self.current_map, self.current_rooms = map_create()
+        self.current_map = None
+        self.current_rooms = []
+
+        if seed is None:
+            seed = random.SystemRandom().randint(0, 0x7FFFFFFF)
+
+        self.random = obj_RandomStreams(seed)
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state['object_index'] = None
+        state['scheduler'] = None
+
+        return state
+
+    def __setstate__(self, state):
+
+        # games saved when a map was a list of tile columns
+        if isinstance(state['current_map'], list):
+            state['current_map'] = map_from_tiles(state['current_map'])
+
+            for levels in (state['maps_previous'], state['maps_next']):
+                for i, (x, y, level_map, rooms, objects) in enumerate(levels):
+                    levels[i] = (x, y, map_from_tiles(level_map), rooms,
+                                 objects)
+
+        self.__dict__.update(state)
+
+    def add_object(self, obj):
+
+        '''Places an object on the current level.'''
+
+        self.current_objects.append(obj)
+        self.object_index.add(obj)
+        self.scheduler.add(obj)
+
+        if obj.exitportal:
+            self.current_portals.append(obj)
+
+    def remove_object(self, obj):
+
+        '''Takes an object off the current level.'''
+
+        self.current_objects.remove(obj)
+        self.object_index.remove(obj)
+        self.scheduler.remove(obj)
+
+        if obj.exitportal:
+            self.current_portals.remove(obj)
+
+    def objects_reindex(self):
+
+        '''Rebuilds object_index, scheduler and current_portals after
+        current_objects has been swapped out.'''
+
+        if self.object_index:
+            self.object_index.clear()
+
+        self.object_index = obj_ObjectIndex(self.current_objects)
+        self.scheduler = obj_TurnScheduler(self.current_objects, self.time)
+
+        self.current_portals = [obj for obj in self.current_objects
+                                if obj.exitportal]
+
+    def take_turns(self, duration):
+
+        '''Lets the actors of the current level act for duration game time.
+
+        Called after the player has acted, with the time the player's turn
+        took.
+
+        '''
+
+        self.scheduler.run(duration)
+        self.time = self.scheduler.time
+
+    def objects_wake(self, tiles):
+
+        '''Wakes the sleeping actors standing on any of tiles.
+
+        Args:
+            tiles (iterable): (x, y) map coords.
+
+        '''
+
+        if not self.scheduler.dormant:
+            return
+
+        for x, y in tiles:
+            for obj in self.object_index.objects_at(x, y):
+                self.scheduler.wake(obj)
+
+    def level_seed(self, current_level):
+
+        '''Returns the seed the level at depth current_level is generated from.'''
+
+        return self.random.derive(current_level)
+
+    def level_new(self):
+
+        '''Makes a newly generated level the current level.
+
+        The level is usually ready, generated by LEVEL_PREGEN while the player
+        was on the level above.  PLAYER must already be in current_objects.
+
+        '''
+
+        current_level = len(self.maps_previous) + 1
+
+        (self.current_map, self.current_rooms, level_objects,
+            (PLAYER.x, PLAYER.y)) = LEVEL_PREGEN.take(current_level,
+                self.level_seed(current_level))
+
+        self.current_objects = [PLAYER] + level_objects
+        self.objects_reindex()
+
+        map_load_fov(self.current_map)
+
+        self.level_pregen()
+
+    def level_pregen(self):
+
+        '''Starts generating the level below, unless it exists already.'''
+
+        current_level = len(self.maps_previous) + 1
+
+        if self.maps_next or current_level >= constants.MAP_NUM_LEVELS:
+            return
+
+        if LEVEL_PREGEN.current_level != current_level + 1:
+            LEVEL_PREGEN.start(current_level + 1,
+                               self.level_seed(current_level + 1))
+
+    def level_pop(self, levels):
+
+        '''Takes the last level off maps_previous or maps_next.
+
+        Levels still in the save file are read from it first.
+
+        Returns:
+            level (tuple): (player x, player y, map, rooms, objects)
+
+        '''
+
+        level = levels.pop()
+
+        if isinstance(level, struc_SaveRecord):
+            level = level.load()
+
+        return level
+
+    def levels_delete(self):
+
+        '''Frees the libtcod maps of every level, the game is being thrown
+        away.  Levels still in the save file have none.'''
+
+        map_delete(self.current_map)
+
+        for level in self.maps_previous + self.maps_next:
+            if not isinstance(level, struc_SaveRecord):
+                map_delete(level[2])
 
     def transition_next(self):
 
@@ -269,32 +698,24 @@ class obj_Game:
 
         if len(self.maps_next) == 0:
 
-            self.current_objects = [PLAYER]
-
             PLAYER.animation_init()
 
-            self.current_map, self.current_rooms = map_create()
-            map_place_objects(self.current_rooms)
+            self.level_new()
 
         else:
 
             (PLAYER.x, PLAYER.y, self.current_map, self.current_rooms,
-            self.current_objects) = self.maps_next[-1]
+            self.current_objects) = self.level_pop(self.maps_next)
+
+            self.objects_reindex()
 
             for obj in self.current_objects:
                 obj.animation_init()
 
-            map_make_fov(self.current_map)
-
-            FOV_CALCULATE = True
-
-            del self.maps_next[-1]
-
+            map_load_fov(self.current_map)
 
     def transition_previous(self):
 
-        global FOV_CALCULATE
-
         if len(self.maps_previous) != 0:
 
             for obj in self.current_objects:
@@ -304,16 +725,43 @@ class obj_Game:
                     self.current_rooms, self.current_objects))
 
             (PLAYER.x, PLAYER.y, self.current_map, self.current_rooms,
-                self.current_objects) = self.maps_previous[-1]
+                self.current_objects) = self.level_pop(self.maps_previous)
+
+            self.objects_reindex()
 
             for obj in self.current_objects:
                 obj.animation_init()
 
-            map_make_fov(self.current_map)
+            map_load_fov(self.current_map)
+
+class obj_LegacyUnpickler(pickle.Unpickler):
+
+    '''Reads saves from before the record format of game_save.
 
-            FOV_CALCULATE = True
+    Those saves are a single gzip pickle of [GAME, PLAYER], written while the
+    game ran as a script.  The classes whose attributes have changed since
+    convert them in their __setstate__, this only finds the classes again and
+    creates the ones that used to be old-style classes.
 
-            del self.maps_previous[-1]
+    '''
+
+    def find_class(self, module, name):
+
+        # the game ran as a script when it was saved
+        if module == "__main__":
+            module = __name__
+
+        return pickle.Unpickler.find_class(self, module, name)
+
+    def _instantiate(self, klass, k):
+
+        # only called by python 2, which would otherwise call __init__ of
+        # struc_Tile and obj_Actor, old-style classes when they were saved
+        if isinstance(klass, type) and len(self.stack) == k + 1:
+            del self.stack[k:]
+            self.append(klass.__new__(klass))
+        else:
+            pickle.Unpickler._instantiate(self, klass, k)
 
 class obj_Spritesheet:
 
@@ -438,207 +886,2147 @@ class obj_Room:
         center_x = (self.x1 + self.x2) / 2
         center_y = (self.y1 + self.y2) / 2
 
-        return (center_x, center_y)
+        return (center_x, center_y)
+
+    def intersect(self, other):
+
+        # return True if other obj intersects with this one
+        objects_intersect = (self.x1 <= other.x2 and self.x2 >= other.x1 and
+                             self.y1 <= other.y2 and self.y2 >= other.y1)
+
+        return objects_intersect
+
+class obj_ObjectIndex(object):
+
+    '''Spatial index of the actors on a level.
+
+    Files every actor under its (x, y) map coords so finding what stands on a
+    tile does not require a scan of GAME.current_objects.  Actors that are
+    filed here move themselves within the index whenever their x or y changes.
+
+    The index also keeps the actors in the order they are drawn in, deepest
+    first, so drawing does not sort the level every frame.  An actor is only
+    moved within that order when it is added, removed or its depth changes.
+
+    Attributes:
+        objects (arg, list): actors to index, usually GAME.current_objects.
+        cells (dict): maps (x, y) to the list of actors on that tile.
+        draw_order (list): every actor, sorted deepest first.  Actors of the
+            same depth are kept in the order they were added.  Do not modify.
+
+    '''
+
+    def __init__(self, objects = ()):
+
+        self.cells = {}
+        self.draw_order = []
+
+        # -depth of every actor in draw_order, so it can be bisected
+        self._draw_keys = []
+
+        for obj in objects:
+            self.add(obj)
+
+    def add(self, obj):
+
+        self.cells.setdefault((obj.x, obj.y), []).append(obj)
+        self._draw_insert(obj, obj.depth)
+
+        obj._index = self
+
+    def remove(self, obj):
+
+        self._cell_remove(obj, obj.x, obj.y)
+        self._draw_remove(obj)
+
+        obj._index = None
+
+    def move(self, obj, new_x, new_y):
+
+        self._cell_remove(obj, obj.x, obj.y)
+
+        self.cells.setdefault((new_x, new_y), []).append(obj)
+
+    def move_depth(self, obj, new_depth):
+
+        self._draw_remove(obj)
+        self._draw_insert(obj, new_depth)
+
+    def clear(self):
+
+        for cell in self.cells.values():
+            for obj in cell:
+                obj._index = None
+
+        self.cells = {}
+        self.draw_order = []
+        self._draw_keys = []
+
+    def objects_at(self, x, y):
+
+        '''Returns the actors on tile (x, y), do not modify the result.'''
+
+        return self.cells.get((x, y), ())
+
+    def _cell_remove(self, obj, x, y):
+
+        cell = self.cells[(x, y)]
+        cell.remove(obj)
+
+        if not cell:
+            del self.cells[(x, y)]
+
+    def _draw_insert(self, obj, depth):
+
+        i = bisect.bisect_right(self._draw_keys, -depth)
+
+        self._draw_keys.insert(i, -depth)
+        self.draw_order.insert(i, obj)
+
+    def _draw_remove(self, obj):
+
+        # only actors of the same depth need to be searched
+        start = bisect.bisect_left(self._draw_keys, -obj.depth)
+        end = bisect.bisect_right(self._draw_keys, -obj.depth)
+
+        i = self.draw_order.index(obj, start, end)
+
+        del self._draw_keys[i]
+        del self.draw_order[i]
+
+class obj_MapLayer(object):
+
+    '''Pre-rendered terrain for a single map.
+
+    The whole map is rendered once in its visible and its explored colors.
+    The surface that actually gets drawn is assembled from those two and only
+    the tiles whose FOV or explored state changed are copied over again, so
+    drawing the terrain of an unchanged map costs a single blit.  Tiles are
+    copied with one Surface.blits call per surface rather than a blit each.
+
+    Attributes:
+        tile_map (arg, struc_TileGrid): the map to render.
+        surface_visible (pygame.Surface): every tile as it looks inside the FOV.
+        surface_explored (pygame.Surface): every tile as it looks once explored.
+        surface (pygame.Surface): the terrain as it should be drawn.
+        tile_state (numpy.ndarray): what surface currently shows for each
+            tile, one of the LAYER_ values.
+
+    '''
+
+    LAYER_HIDDEN = 0
+    LAYER_EXPLORED = 1
+    LAYER_VISIBLE = 2
+
+    def __init__(self, tile_map):
+
+        size = (tile_map.width * constants.CELL_WIDTH,
+                tile_map.height * constants.CELL_HEIGHT)
+
+        self.surface_visible = pygame.Surface(size)
+        self.surface_explored = pygame.Surface(size)
+
+        self.surface = pygame.Surface(size)
+        self.surface.fill(constants.COLOR_BLACK)
+
+        self.tile_state = numpy.zeros((tile_map.width, tile_map.height),
+                                      dtype = numpy.uint8)
+
+        tile_is_wall = tile_map.block_path.tolist()
+
+        visible_tiles = []
+        explored_tiles = []
+
+        for x in range(tile_map.width):
+            for y in range(tile_map.height):
+                coords = (x * constants.CELL_WIDTH, y * constants.CELL_HEIGHT)
+
+                if tile_is_wall[x][y]:
+                    visible_tiles.append((ASSETS.S_WALL, coords))
+                    explored_tiles.append((ASSETS.S_WALLEXPLORED, coords))
+                else:
+                    visible_tiles.append((ASSETS.S_FLOOR, coords))
+                    explored_tiles.append((ASSETS.S_FLOOREXPLORED, coords))
+
+        self.surface_visible.blits(visible_tiles, False)
+        self.surface_explored.blits(explored_tiles, False)
+
+    def render_tile(self, is_wall, x, y):
+
+        '''Draws a tile onto the visible and explored surfaces.'''
+
+        coords = (x * constants.CELL_WIDTH, y * constants.CELL_HEIGHT)
+
+        if is_wall:
+            self.surface_visible.blit(ASSETS.S_WALL, coords)
+            self.surface_explored.blit(ASSETS.S_WALLEXPLORED, coords)
+        else:
+            self.surface_visible.blit(ASSETS.S_FLOOR, coords)
+            self.surface_explored.blit(ASSETS.S_FLOOREXPLORED, coords)
+
+    def update(self, tile_map, fov_mask):
+
+        '''Redraws the tiles whose FOV or explored state has changed.
+
+        Args:
+            tile_map (struc_TileGrid): the map this layer was rendered from.
+            fov_mask (numpy.ndarray): True for every tile in the current FOV.
+
+        '''
+
+        new_state = numpy.where(tile_map.explored,
+                                self.LAYER_EXPLORED,
+                                self.LAYER_HIDDEN).astype(numpy.uint8)
+        new_state[fov_mask] = self.LAYER_VISIBLE
+
+        changed_tiles = numpy.argwhere(new_state != self.tile_state)
+        changed_states = new_state[changed_tiles[:, 0], changed_tiles[:, 1]]
+
+        copies = []
+
+        for (x, y), state in zip(changed_tiles.tolist(),
+                                 changed_states.tolist()):
+            tile_rect = pygame.Rect(x * constants.CELL_WIDTH,
+                                    y * constants.CELL_HEIGHT,
+                                    constants.CELL_WIDTH, constants.CELL_HEIGHT)
+
+            if state == self.LAYER_VISIBLE:
+                copies.append((self.surface_visible, tile_rect, tile_rect))
+            elif state == self.LAYER_EXPLORED:
+                copies.append((self.surface_explored, tile_rect, tile_rect))
+            else:
+                self.surface.fill(constants.COLOR_BLACK, tile_rect)
+
+        self.surface.blits(copies, False)
+
+        self.tile_state = new_state
+
+    def tile_changed(self, tile_map, x, y):
+
+        '''Renders a tile again after it changed on the map.'''
+
+        self.render_tile(tile_map.block_path[x, y], x, y)
+        self.draw_tile(self.tile_state[x, y], x, y)
+
+    def draw_tile(self, state, x, y):
+
+        '''Copies a tile in the given state onto the drawn surface.'''
+
+        tile_rect = pygame.Rect(x * constants.CELL_WIDTH,
+                                y * constants.CELL_HEIGHT,
+                                constants.CELL_WIDTH, constants.CELL_HEIGHT)
+
+        if state == self.LAYER_VISIBLE:
+            self.surface.blit(self.surface_visible, tile_rect, tile_rect)
+        elif state == self.LAYER_EXPLORED:
+            self.surface.blit(self.surface_explored, tile_rect, tile_rect)
+        else:
+            self.surface.fill(constants.COLOR_BLACK, tile_rect)
+
+class obj_TurnScheduler(object):
+
+    '''Decides which actors take a turn and in what order.
+
+    Actors with an ai wait in a heap keyed by the game time of their next
+    turn, so running the level for a while only touches the actors whose turn
+    comes up.  Actors without an ai (items, corpses, stairs) are never added.
+    Removing an actor marks its heap entry instead of searching the heap.
+
+    An actor with nothing to do can be put to sleep, which takes it out of
+    the heap until something wakes it, so actors far from the player cost
+    nothing however many turns go by.
+
+    Attributes:
+        objects (arg, list): actors to schedule, usually GAME.current_objects.
+            They all get their first turn at time.
+        time (arg, int): game time the scheduler starts at.
+        dormant (dict): maps id(actor) to (time of its next turn, actor) for
+            the actors that are asleep.
+
+    '''
+
+    def __init__(self, objects = (), time = 0):
+
+        self.time = time
+        self.dormant = {}
+
+        self._queue = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+        for obj in objects:
+            self.add(obj)
+
+    def add(self, obj, time = None):
+
+        '''Schedules the next turn of obj, by default at the current time.'''
+
+        if not obj.ai:
+            return
+
+        self.remove(obj)
+
+        if time is None:
+            time = self.time
+
+        entry = [time, next(self._counter), obj]
+
+        self._entries[id(obj)] = entry
+        heapq.heappush(self._queue, entry)
+
+    def remove(self, obj):
+
+        entry = self._entries.pop(id(obj), None)
+
+        if entry:
+            entry[-1] = None
+
+        self.dormant.pop(id(obj), None)
+
+    def sleep(self, obj):
+
+        '''Takes obj out of the queue until wake is called for it.
+
+        Meant to be called by an ai during its own turn.  The time of the
+        turn obj would have had next is kept, so waking it up early does not
+        give it an extra turn.
+
+        '''
+
+        self.remove(obj)
+
+        self.dormant[id(obj)] = (self.time + obj.creature.action_delay, obj)
+
+    def wake(self, obj):
+
+        '''Puts obj back in the queue if it is asleep.'''
+
+        if id(obj) not in self.dormant:
+            return
+
+        time, obj = self.dormant.pop(id(obj))
+
+        self.add(obj, max(time, self.time))
+
+    def run(self, duration):
+
+        '''Gives a turn to every actor whose turn comes up within duration.
+
+        Actors act in the order of their turn times, the actors sharing a time
+        in the order they were added.  When enough actors share a time, those
+        BATCH_AI can handle act first, all at once and not quite in turn
+        order, see obj_BatchAI.  An actor that loses its ai while waiting is
+        dropped.
+
+        '''
+
+        end_time = self.time + duration
+
+        queue = self._queue
+
+        while queue and queue[0][0] < end_time:
+            time = queue[0][0]
+            self.time = time
+
+            # every actor whose turn is now
+            group = []
+
+            while queue and queue[0][0] == time:
+                entry = heapq.heappop(queue)
+
+                if entry[2] is not None:
+                    group.append(entry)
+
+            if (constants.AI_BATCH and
+                    len(group) >= constants.AI_BATCH_MIN_ACTORS):
+                handled = BATCH_AI.take_turns([entry[2] for entry in group])
+            else:
+                handled = ()
+
+            # an actor may be removed by the turn of another, which clears
+            # its entry
+            for entry in group:
+                obj = entry[2]
+
+                if obj is not None and obj.ai and id(obj) not in handled:
+                    obj.ai.take_turn()
+
+            # the entries are reused for the actors' next turns
+            for entry in group:
+                obj = entry[2]
+
+                if obj is None:
+                    continue
+
+                if obj.ai and obj.creature:
+                    entry[0] = time + obj.creature.action_delay
+                    entry[1] = next(self._counter)
+                    heapq.heappush(queue, entry)
+                else:
+                    del self._entries[id(obj)]
+
+        self.time = end_time
+
+class obj_DistanceField(object):
+
+    '''Number of steps from every tile near a target to the target.
+
+    The distances are found with a breadth first search in all 8 directions,
+    done on whole arrays at once, over the tiles within radius of the target.
+    Every monster chasing the same target reads the same field, and it is only
+    searched again once the target moves or the map changes.
+
+    Attributes:
+        radius (arg, int): how far from the target the search goes.
+        distance (numpy.ndarray): steps to the target for the tiles of the
+            window around the target, indexed [x - x_origin, y - y_origin].
+            UNREACHED where the target can't be reached within radius.
+        x_origin (int): map x coord of the window's first column.
+        y_origin (int): map y coord of the window's first row.
+        target_x (int): map x coord the field leads to.
+        target_y (int): map y coord the field leads to.
+
+    '''
+
+    UNREACHED = -1
+
+    def __init__(self, radius):
+
+        self.radius = radius
+
+        self.distance = None
+        self.x_origin = 0
+        self.y_origin = 0
+        self.target_x = None
+        self.target_y = None
+
+        self._key = None
+
+    def update(self, tile_map, target_x, target_y):
+
+        '''Searches the field again if the target or the map has changed.'''
+
+        key = (tile_map, tile_map.version, target_x, target_y)
+
+        if key == self._key:
+            return
+
+        self._key = key
+        self.target_x, self.target_y = target_x, target_y
+
+        self.x_origin = max(target_x - self.radius, 0)
+        self.y_origin = max(target_y - self.radius, 0)
+        x_end = min(target_x + self.radius + 1, tile_map.width)
+        y_end = min(target_y + self.radius + 1, tile_map.height)
+
+        walkable = ~tile_map.block_path[self.x_origin:x_end,
+                                        self.y_origin:y_end]
+
+        distance = numpy.full(walkable.shape, self.UNREACHED,
+                              dtype = numpy.int32)
+
+        frontier = numpy.zeros(walkable.shape, dtype = bool)
+        frontier[target_x - self.x_origin, target_y - self.y_origin] = True
+        distance[frontier] = 0
+
+        reached = frontier.copy()
+
+        step = 0
+
+        while step < self.radius and frontier.any():
+            step += 1
+
+            # grow the frontier by a tile in all 8 directions
+            grown_x = frontier.copy()
+            grown_x[1:, :] |= frontier[:-1, :]
+            grown_x[:-1, :] |= frontier[1:, :]
+
+            grown = grown_x.copy()
+            grown[:, 1:] |= grown_x[:, :-1]
+            grown[:, :-1] |= grown_x[:, 1:]
+
+            frontier = grown & walkable & ~reached
+
+            distance[frontier] = step
+            reached |= frontier
+
+        self.distance = distance
+
+    def get(self, x, y):
+
+        '''Returns the steps from (x, y) to the target, UNREACHED if unknown.'''
+
+        x -= self.x_origin
+        y -= self.y_origin
+
+        if (self.distance is None or
+                not 0 <= x < self.distance.shape[0] or
+                not 0 <= y < self.distance.shape[1]):
+            return self.UNREACHED
+
+        return int(self.distance[x, y])
+
+    def lookup(self, xs, ys):
+
+        '''Like get, for whole arrays of coords at once.
+
+        Args:
+            xs (numpy.ndarray): map x coords.
+            ys (numpy.ndarray): map y coords, same shape as xs.
+
+        Returns:
+            distance (numpy.ndarray): steps to the target from each coord.
+
+        '''
+
+        distance = numpy.full(xs.shape, self.UNREACHED, dtype = numpy.int32)
+
+        if self.distance is None:
+            return distance
+
+        xs = xs - self.x_origin
+        ys = ys - self.y_origin
+
+        inside = ((xs >= 0) & (xs < self.distance.shape[0]) &
+                  (ys >= 0) & (ys < self.distance.shape[1]))
+
+        distance[inside] = self.distance[xs[inside], ys[inside]]
+
+        return distance
+
+    def steps_towards(self, x, y):
+
+        '''Returns the steps from (x, y) that get closer to the target.
+
+        Returns:
+            steps (list): (dx, dy) of each neighbouring tile closer to the
+                target than (x, y), best first.  Empty if (x, y) is not
+                within the field.
+
+        '''
+
+        current = self.get(x, y)
+
+        if current == self.UNREACHED:
+            return []
+
+        steps = []
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbour = self.get(x + dx, y + dy)
+
+                if neighbour != self.UNREACHED and neighbour < current:
+                    # among equal distances, prefer the straighter line
+                    line = ((self.target_x - x - dx) ** 2 +
+                            (self.target_y - y - dy) ** 2)
+                    steps.append((neighbour, line, (dx, dy)))
+
+        steps.sort()
+
+        return [step for neighbour, line, step in steps]
+
+class obj_PathCache(object):
+
+    '''A route to a goal that an actor keeps from turn to turn.
+
+    The route is only found again, with map_find_path, when the goal moves
+    more than retarget_distance tiles from where the route leads, a tile
+    ahead on the route becomes blocked, the actor strays off the route or the
+    actor is on a different map.
+
+    Attributes:
+        retarget_distance (arg, int): how far the goal can move before the
+            route is found again.
+        steps (list): (x, y) of the tiles left to walk, the next step last.
+        goal ((int, int)): map coords the route leads to.
+        recomputes (int): number of times a route has been found.
+
+    '''
+
+    def __init__(self, retarget_distance = constants.PATH_RETARGET_DISTANCE):
+
+        self.retarget_distance = retarget_distance
+        self.recomputes = 0
+
+        self.clear()
+
+    def __getstate__(self):
+
+        # the route is found again after loading
+        state = self.__dict__.copy()
+        state['steps'] = []
+        state['goal'] = None
+        state['_tile_map'] = None
+
+        return state
+
+    def clear(self):
+
+        self.steps = []
+        self.goal = None
+
+        self._tile_map = None
+        self._version = None
+
+    def next_step(self, tile_map, x, y, goal_x, goal_y):
+
+        '''Returns the step to take from (x, y) towards the goal.
+
+        Args:
+            tile_map (struc_TileGrid): the map the actor is on.
+            x (int): x map coord of the actor.
+            y (int): y map coord of the actor.
+            goal_x (int): x map coord of the goal.
+            goal_y (int): y map coord of the goal.
+
+        Returns:
+            step ((int, int)): (dx, dy) of the next step, None if there is no
+                route or the goal has been reached.
+
+        '''
+
+        if self._is_stale(tile_map, x, y, goal_x, goal_y):
+            self.steps = map_find_path(tile_map, x, y, goal_x, goal_y)
+            self.steps.reverse()
+            self.goal = (goal_x, goal_y)
+
+            self._tile_map = tile_map
+            self._version = tile_map.version
+
+            self.recomputes += 1
+
+        # the last step taken was a success
+        if self.steps and self.steps[-1] == (x, y):
+            self.steps.pop()
+
+        if not self.steps:
+            return None
+
+        next_x, next_y = self.steps[-1]
+
+        return (next_x - x, next_y - y)
+
+    def _is_stale(self, tile_map, x, y, goal_x, goal_y):
+
+        if tile_map is not self._tile_map or self.goal is None:
+            return True
+
+        if max(abs(goal_x - self.goal[0]),
+               abs(goal_y - self.goal[1])) > self.retarget_distance:
+            return True
+
+        if not self.steps:
+            return False
+
+        if tile_map.version != self._version:
+            self._version = tile_map.version
+
+            for step_x, step_y in self.steps:
+                if tile_map.block_path[step_x, step_y]:
+                    return True
+
+        next_x, next_y = self.steps[-1]
+
+        return max(abs(next_x - x), abs(next_y - y)) > 1
+
+class obj_BatchAI(object):
+
+    '''Takes the turns of a crowd of chasing and fleeing monsters at once.
+
+    Does what ai_Chase.take_turn and ai_Flee.take_turn would do for each
+    monster, with the positions of the whole crowd in arrays: who can be seen
+    is read from FOV_MASK, the step each monster wants is read from a
+    distance field, and monsters wanting the same tile are sorted out by
+    letting the one nearest its goal go first.  Only the moves are written
+    back to the actors one by one.  Attacks and the odd monster that has no
+    step to take still go through the usual per monster calls.
+
+    The crowd does not act in turn order the way obj_TurnScheduler.run has
+    single monsters act: every move is made before any attack, and the
+    monsters with no step in their field move last.  Where no two monsters
+    want the same tile the outcome is the same, but in a crowded fight the
+    same seed and input can play out differently depending on whether the
+    crowd reached AI_BATCH_MIN_ACTORS.
+
+    Attributes:
+        flee_field (obj_DistanceField): leads fleeing monsters to the room
+            farthest from the player, see map_find_farthest_room.  It covers
+            the whole map, steps on it that near the player are not taken.
+
+    '''
+
+    # the 8 steps a monster can take, as columns of DIRECTIONS
+    DIRECTIONS = numpy.array([(dx, dy) for dx in (-1, 0, 1)
+                                       for dy in (-1, 0, 1)
+                                       if dx or dy]).T
+
+    def __init__(self):
+
+        self.flee_field = obj_DistanceField(0)
+
+    def take_turns(self, actors):
+
+        '''Takes the turns of the chasing and fleeing monsters among actors.
+
+        Args:
+            actors (list): actors whose turn it is, in turn order.
+
+        Returns:
+            handled (set): id() of every actor whose turn was taken, the rest
+                still need their ai's take_turn called.
+
+        '''
+
+        if FOV_MASK is None:
+            return set()
+
+        crowd = [obj for obj in actors
+                 if obj.ai.__class__ is ai_Chase or obj.ai.__class__ is ai_Flee]
+
+        if not crowd:
+            return set()
+
+        xs = numpy.array([obj.x for obj in crowd])
+        ys = numpy.array([obj.y for obj in crowd])
+        flee = numpy.array([obj.ai.__class__ is ai_Flee for obj in crowd])
+
+        # out of sight monsters sleep until the player can see them, unless a
+        # noise has them looking for the player
+        awake = FOV_MASK[xs, ys]
+
+        for i in numpy.flatnonzero(~awake):
+            if crowd[i].ai.alert:
+                crowd[i].ai.alert -= 1
+                awake[i] = True
+            else:
+                GAME.scheduler.sleep(crowd[i])
+
+        # chasers next to the player attack, the others move
+        attack = (~flee & awake &
+                  ((xs - PLAYER.x) ** 2 + (ys - PLAYER.y) ** 2 < 4))
+
+        move = awake & ~attack
+
+        if move.any():
+            moved, stuck = self._move(xs, ys, flee, move)
+
+            for i in moved:
+                crowd[i].x, crowd[i].y = int(xs[i]), int(ys[i])
+        else:
+            stuck = []
+
+        for i in numpy.flatnonzero(attack):
+            if crowd[i].ai and PLAYER.creature.current_hp > 0:
+                crowd[i].creature.attack(PLAYER)
+
+        # fleers with no step in their field or every step taken run straight
+        # away, chasers outside their field find a route of their own
+        for i in stuck:
+            if not crowd[i].ai:
+                continue
+
+            if flee[i]:
+                crowd[i].move_away(PLAYER)
+            else:
+                crowd[i].ai.chase()
+
+        return set(id(obj) for obj in crowd)
+
+    def _move(self, xs, ys, flee, move):
+
+        '''Finds the steps of the monsters in move, updating xs and ys.
+
+        Returns:
+            moved (list): indices of the monsters that took a step.
+            stuck (list): indices of the monsters that need a straight line
+                move instead.
+
+        '''
+
+        current_map = GAME.current_map
+
+        CHASE_FIELD.update(current_map, PLAYER.x, PLAYER.y)
+        target_x = numpy.full(xs.shape, PLAYER.x)
+        target_y = numpy.full(ys.shape, PLAYER.y)
+
+        current = CHASE_FIELD.lookup(xs, ys)
+        neighbour_xs = xs + self.DIRECTIONS[0][:, None]
+        neighbour_ys = ys + self.DIRECTIONS[1][:, None]
+        neighbour = CHASE_FIELD.lookup(neighbour_xs, neighbour_ys)
+
+        if flee.any():
+            goal_x, goal_y = map_find_farthest_room((PLAYER.x, PLAYER.y))
+
+            self.flee_field.radius = max(current_map.width, current_map.height)
+            self.flee_field.update(current_map, goal_x, goal_y)
+
+            target_x[flee] = goal_x
+            target_y[flee] = goal_y
+
+            current[flee] = self.flee_field.lookup(xs[flee], ys[flee])
+            neighbour[:, flee] = self.flee_field.lookup(
+                neighbour_xs[:, flee], neighbour_ys[:, flee])
+
+        # rank the steps closer to the goal like steps_towards, nearest
+        # first and among equal distances the straighter line
+        line = ((target_x - neighbour_xs) ** 2 +
+                (target_y - neighbour_ys) ** 2).astype(numpy.int64)
+        rank = neighbour.astype(numpy.int64) * (1 << 32) + line
+
+        closer = ((neighbour != obj_DistanceField.UNREACHED) &
+                  (neighbour < current) &
+                  (current != obj_DistanceField.UNREACHED))
+
+        # fleers never step towards the player, even where the way to their
+        # room leads past it
+        if flee.any():
+            nearer_player = ((neighbour_xs - PLAYER.x) ** 2 +
+                             (neighbour_ys - PLAYER.y) ** 2 <
+                             (xs - PLAYER.x) ** 2 + (ys - PLAYER.y) ** 2)
+
+            closer[:, flee] &= ~nearer_player[:, flee]
+
+        unranked = numpy.iinfo(numpy.int64).max
+        rank[~closer] = unranked
+
+        # fleers at their goal or with only steps towards the player, and
+        # monsters outside their field
+        stuck = list(numpy.flatnonzero(move & ~closer.any(axis = 0)))
+
+        # the monsters nearest their goal pick their steps first
+        pending = numpy.flatnonzero(move & closer.any(axis = 0))
+        pending = pending[numpy.argsort(current[pending], kind = "mergesort")]
+
+        occupied = numpy.zeros(current_map.block_path.shape, dtype = bool)
+
+        for (x, y), cell in GAME.object_index.cells.items():
+            for obj in cell:
+                if obj.creature:
+                    occupied[x, y] = True
+                    break
+
+        width, height = occupied.shape
+        moved = []
+
+        # every round, each monster claims its best free tile and the first
+        # claim on a tile wins.  The tiles the winners leave are free to
+        # take next round, so rounds go on until nobody can move
+        while pending.size:
+            step_xs = neighbour_xs[:, pending]
+            step_ys = neighbour_ys[:, pending]
+
+            free = ~occupied[numpy.clip(step_xs, 0, width - 1),
+                             numpy.clip(step_ys, 0, height - 1)]
+
+            pending_rank = numpy.where(free, rank[:, pending], unranked)
+
+            best = pending_rank.argmin(axis = 0)
+            columns = numpy.arange(pending.size)
+            can_step = pending_rank[best, columns] != unranked
+
+            if not can_step.any():
+                break
+
+            claim = step_xs[best, columns] * height + step_ys[best, columns]
+            claim[~can_step] = -1
+
+            claimed, first = numpy.unique(claim, return_index = True)
+            winners = first[claimed >= 0]
+
+            # the winners all claimed different tiles that were free at the
+            # start of the round, so they can move at once
+            i = pending[winners]
+
+            occupied[xs[i], ys[i]] = False
+
+            xs[i] = step_xs[best[winners], winners]
+            ys[i] = step_ys[best[winners], winners]
+
+            occupied[xs[i], ys[i]] = True
+            moved.extend(i.tolist())
+
+            keep = numpy.ones(pending.size, dtype = bool)
+            keep[winners] = False
+            pending = pending[keep]
+
+        # chasers with every step taken wait, fleers run straight away
+        stuck += [i for i in pending if flee[i]]
+
+        return moved, stuck
+
+class obj_TextCache(object):
+
+    '''Least recently used cache of rendered text.
+
+    Most of the text on screen is the same from one frame to the next, so the
+    surfaces font.render produces are kept and handed out again for as long as
+    they are used.  The size of a font's characters is remembered the same way.
+
+    Attributes:
+        max_size (arg, int): number of surfaces kept, once full the least
+            recently used surface is dropped.
+        hits (int): number of renders answered from the cache.
+        misses (int): number of renders that had to call font.render.
+        evictions (int): number of surfaces dropped to stay within max_size.
+
+    '''
+
+    def __init__(self, max_size):
+
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._surfaces = collections.OrderedDict()
+        self._font_sizes = {}
+
+    def render(self, text, font, color, bg = None):
+
+        '''Returns a surface with the text rendered onto it.
+
+        Args:
+            text (str): the text to render.
+            font (pygame.font.Font): font the text is rendered with.
+            color ((int, int, int)): (R, G, B) color of the text.
+            bg ((int, int, int), optional): (R, G, B) color of the background,
+                if not included the background is transparent.
+
+        Returns:
+            surface (pygame.Surface): shared with later calls, do not draw on it.
+
+        '''
+
+        key = (font, text, color, bg)
+
+        # taking the surface out and putting it back marks it most recent
+        surface = self._surfaces.pop(key, None)
+
+        if surface is None:
+            self.misses += 1
+
+            if bg:
+                surface = font.render(text, False, color, bg)
+            else:
+                surface = font.render(text, False, color)
+
+            if len(self._surfaces) >= self.max_size:
+                self._surfaces.popitem(last = False)
+                self.evictions += 1
+
+        else:
+            self.hits += 1
+
+        self._surfaces[key] = surface
+
+        return surface
+
+    def font_size(self, font):
+
+        '''Returns the (width, height) in pixels of a character of the font.'''
+
+        size = self._font_sizes.get(font)
+
+        if size is None:
+            size = font.render('a', False, (0, 0, 0)).get_size()
+            self._font_sizes[font] = size
+
+        return size
+
+    @property
+    def stats(self):
+
+        return {"size": len(self._surfaces),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+class obj_AnimationClock(object):
+
+    '''Decides which frame every animation is showing.
+
+    The clock is advanced by the real length of each frame, so animations
+    keep their speed however much the frame rate varies.  All actors sharing
+    an animation show the same frame, worked out once per frame the first
+    time one of them is drawn.
+
+    Attributes:
+        time (float): seconds of animation played so far.
+
+    '''
+
+    def __init__(self):
+
+        self.time = 0.0
+
+        # (animation_key, animation_speed) to frame index, for this frame
+        self._frames = {}
+
+    def tick(self, milliseconds):
+
+        '''Advances the clock by the length of the last frame.'''
+
+        self.time += milliseconds / 1000.0
+        self._frames = {}
+
+    def frame(self, animation_key, animation_speed, num_frames):
+
+        '''Returns the index of the image an animation is showing.
+
+        Args:
+            animation_key (str): key of the animation in ASSETS.animation_dict.
+            animation_speed (float): time in seconds it takes to loop through
+                the animation.
+            num_frames (int): number of images in the animation.
+
+        '''
+
+        key = (animation_key, animation_speed)
+
+        frame = self._frames.get(key)
+
+        if frame is None:
+            frame = int(self.time * num_frames / animation_speed) % num_frames
+            self._frames[key] = frame
+
+        return frame
+
+class obj_FrameTimer(object):
+
+    '''Times each phase of the frames of game_main_loop.
+
+    A frame is timed between frame_start and frame_end, and each call to lap
+    adds the time since the last lap to a phase.  The last num_samples times
+    of every phase are kept to work out percentiles from, which the debug
+    overlay shows and dump writes to a file.  Time spent in a menu opened by
+    a key counts as input.
+
+    Attributes:
+        num_samples (arg, int): frames the percentiles cover.
+        samples (dict): maps each of PHASES to a deque of its recent times,
+            in seconds.
+        overlay (bool): True if draw_debug shows the percentiles.
+
+    '''
+
+    PHASES = ("input", "fov", "ai", "portals", "map", "objects", "debug",
+              "messages", "flip", "frame")
+
+    # the overlay's numbers are worked out again every this many frames
+    OVERLAY_REFRESH = 30
+
+    def __init__(self, num_samples):
+
+        self.samples = dict((phase, collections.deque(maxlen = num_samples))
+                            for phase in self.PHASES)
+        self.overlay = False
+
+        self._frame = None
+        self._frame_start = None
+        self._mark = None
+
+        self._overlay_lines = []
+        self._overlay_age = 0
+
+    def frame_start(self):
+
+        self._frame = {}
+        self._frame_start = self._mark = timeit.default_timer()
+
+    def lap(self, phase):
+
+        '''Adds the time since the last lap, or the start of the frame, to
+        phase.  Does nothing outside a frame.'''
+
+        if self._frame is None:
+            return
+
+        now = timeit.default_timer()
+
+        self._frame[phase] = self._frame.get(phase, 0.0) + now - self._mark
+        self._mark = now
+
+    def frame_end(self):
+
+        if self._frame is None:
+            return
+
+        for phase, seconds in self._frame.items():
+            self.samples[phase].append(seconds)
+
+        self.samples["frame"].append(timeit.default_timer() -
+                                     self._frame_start)
+
+        self._frame = None
+
+    def summary(self):
+
+        '''Returns the percentiles of every phase.
+
+        Returns:
+            summary (dict): maps each phase with samples to a dict of its
+                p50, p95, p99, mean and max time, in milliseconds, and the
+                number of samples.
+
+        '''
+
+        summary = {}
+
+        for phase in self.PHASES:
+            if not self.samples[phase]:
+                continue
+
+            times = numpy.array(self.samples[phase]) * 1000
+            p50, p95, p99 = numpy.percentile(times, (50, 95, 99))
+
+            summary[phase] = {"p50": float(p50),
+                              "p95": float(p95),
+                              "p99": float(p99),
+                              "mean": float(times.mean()),
+                              "max": float(times.max()),
+                              "samples": len(times)}
+
+        return summary
+
+    def overlay_lines(self):
+
+        '''Returns the lines of text the debug overlay shows.'''
+
+        if self._overlay_age <= 0:
+            summary = self.summary()
+
+            self._overlay_lines = ["phase      p50    p95    p99 ms"]
+
+            for phase in self.PHASES:
+                if phase in summary:
+                    times = summary[phase]
+                    self._overlay_lines.append("%-8s %6.2f %6.2f %6.2f" % (
+                        phase, times["p50"], times["p95"], times["p99"]))
+
+            self._overlay_age = self.OVERLAY_REFRESH
+
+        self._overlay_age -= 1
+
+        return self._overlay_lines
+
+    def dump(self, file_name):
+
+        '''Writes the summary to file_name as JSON.'''
+
+        with open(file_name, 'w') as file:
+            json.dump({"date": datetime.datetime.now().isoformat(),
+                       "phases": self.summary()},
+                      file, indent = 2, sort_keys = True)
+
+class obj_Profiler(object):
+
+    '''Profiles a number of frames or turns of game_main_loop.
+
+    Two kinds of profiles can be captured.  "cprofile" runs cProfile and
+    writes a .pstats file.  "sample" runs a thread that looks at the main
+    thread's stack every constants.PROFILE_SAMPLE_INTERVAL seconds and writes
+    the stacks seen, with how often they were seen, to a .collapsed file
+    that flame graph tools read.  Sampling slows the game down far less.
+    Files are written to data/, named by the time the capture started, down
+    to the microsecond, the seed of the game and the level it started on, so
+    captures of games played one after the other never overwrite each other.
+
+    Attributes:
+        mode (str): "cprofile" or "sample" while a capture is running, else
+            None.
+        remaining (int): frames or turns left to capture.
+        unit (str): "frames" or "turns".
+
+    '''
+
+    MODES = ("cprofile", "sample")
+
+    def __init__(self):
+
+        self.mode = None
+        self.remaining = 0
+        self.unit = "frames"
+
+        self._file_name = None
+        self._profile = None
+        self._thread = None
+        self._thread_stop = None
+        self._stacks = None
+
+    def start(self, mode, count, unit = "frames"):
+
+        '''Starts capturing count frames or turns, unless a capture is running.
+
+        Args:
+            mode (str): "cprofile" or "sample".
+            count (int): number of frames or turns to capture.
+            unit (str, optional): "frames", or "turns" to count only the
+                frames where the player acted.
+
+        Returns:
+            started (bool): False if a capture was already running.
+
+        '''
+
+        if self.mode:
+            return False
+
+        if mode not in self.MODES:
+            raise ValueError("unknown profile mode: " + repr(mode))
+
+        self.mode = mode
+        self.remaining = count
+        self.unit = unit
+
+        self._file_name = ("data/profile_" +
+            datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") +
+            "_seed" + str(GAME.random.seed) +
+            "_level" + str(len(GAME.maps_previous) + 1))
+
+        if mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._stacks = collections.Counter()
+            self._thread_stop = threading.Event()
+            self._thread = threading.Thread(target = self._sample,
+                args = (threading.current_thread().ident,))
+            self._thread.daemon = True
+            self._thread.start()
+
+        return True
+
+    def frame_end(self, player_acted):
+
+        '''Counts a frame of game_main_loop, stops once enough are captured.'''
+
+        if not self.mode:
+            return
+
+        if self.unit == "frames" or player_acted:
+            self.remaining -= 1
+
+        if self.remaining <= 0:
+            self.stop()
+
+    def stop(self):
+
+        '''Stops the capture and writes it to a file.
+
+        Returns:
+            file_name (str): the file written, None if nothing was captured.
+
+        '''
+
+        if not self.mode:
+            return None
+
+        if self.mode == "cprofile":
+            self._profile.disable()
+
+            file_name = self._file_name + ".pstats"
+            self._profile.dump_stats(file_name)
+
+            self._profile = None
+
+        else:
+            self._thread_stop.set()
+            self._thread.join()
+
+            file_name = self._file_name + ".collapsed"
+
+            with open(file_name, 'w') as file:
+                for stack, count in sorted(self._stacks.items()):
+                    file.write(stack + " " + str(count) + "\n")
+
+            self._thread = None
+            self._thread_stop = None
+            self._stacks = None
+
+        self.mode = None
+
+        game_message("Profile written to " + file_name, constants.COLOR_WHITE)
+
+        return file_name
+
+    def _sample(self, thread_id):
+
+        while not self._thread_stop.is_set():
+            frame = sys._current_frames().get(thread_id)
+
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(os.path.basename(code.co_filename) + ":" +
+                             code.co_name + ":" + str(code.co_firstlineno))
+                frame = frame.f_back
+
+            if stack:
+                self._stacks[";".join(reversed(stack))] += 1
+
+            self._thread_stop.wait(constants.PROFILE_SAMPLE_INTERVAL)
+
+class obj_RandomStreams(object):
+
+    '''Seeded random number generators, one for each part of the game.
+
+    Each stream is seeded from the same seed and its own name, so a part of
+    the game rolling more or fewer numbers does not change what the others
+    roll.  Streams are plain random.Random generators, they are pickled with
+    the game and pick up where they left off after loading.  A seed replays
+    the same rolls on the same major version of Python.
+
+    Attributes:
+        seed (arg, int): seed every stream is derived from.
+        mapgen (random.Random): map layout and the monsters placed on it.
+        loot (random.Random): items and their stats.
+        combat (random.Random): rolls made in fights.
+        ai (random.Random): decisions made by monsters.
+        names (random.Random): names of creatures, see gen_name.
+
+    '''
+
+    STREAMS = ("mapgen", "loot", "combat", "ai", "names")
+
+    def __init__(self, seed):
+
+        self.seed = seed
+
+        for name in self.STREAMS:
+            setattr(self, name, random.Random(self.derive(name)))
+
+    def derive(self, *keys):
+
+        '''Returns a new seed made from this seed and keys.
+
+        The same seed and keys always give the same new seed.
+
+        '''
+
+        key = ":".join(str(key) for key in (self.seed,) + keys)
+
+        return zlib.crc32(key.encode("ascii")) & 0x7FFFFFFF
+
+class obj_LevelPregen(object):
+
+    '''Generates a level on a background thread.
+
+    While the player is on the deepest level reached so far, the level below
+    is generated with gen_level, so taking the stairs down only installs a
+    finished level.
+
+    Attributes:
+        current_level (int): depth of the level being generated, None when
+            no level is.
+        seed (int): seed of the level being generated.
+
+    '''
+
+    def __init__(self):
+
+        self.current_level = None
+        self.seed = None
+
+        self._thread = None
+        self._level = None
+        self._error = None
+
+    def start(self, current_level, seed):
+
+        '''Starts generating a level, anything generated before is dropped.'''
+
+        self.discard()
+
+        self.current_level = current_level
+        self.seed = seed
+
+        self._thread = threading.Thread(target = self._generate)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def take(self, current_level, seed):
+
+        '''Returns a generated level, see gen_level.
+
+        Waits for the background thread if it is still working on the level.
+        A level that was never started is generated right away.
+
+        '''
+
+        if (self._thread is None or
+                (current_level, seed) != (self.current_level, self.seed)):
+            self.discard()
+            return gen_level(current_level, seed)
+
+        self._thread.join()
+
+        level, error = self._level, self._error
+        self._level = None
+        self.discard()
+
+        if error:
+            # raised again with the traceback of the background thread,
+            # which Python 2 does not keep with the exception
+            if sys.version_info[0] < 3:
+                exec("raise error[0], error[1], error[2]")
+
+            raise error[1].with_traceback(error[2])
+
+        return level
+
+    def discard(self):
+
+        '''Drops the level, waiting for the thread if it is still running.'''
+
+        if self._thread:
+            self._thread.join()
+
+        if self._level:
+            map_delete(self._level[0])
+
+        self.current_level = None
+        self.seed = None
+
+        self._thread = None
+        self._level = None
+        self._error = None
+
+    def _generate(self):
+
+        try:
+            self._level = gen_level(self.current_level, self.seed)
+        except Exception:
+            self._error = sys.exc_info()
+
+class obj_InputLive(object):
+
+    '''Input source that reads the keyboard, mouse and window through pygame.
+
+    game_handle_keys and the menus opened during a game read all player input
+    from the INPUT global, this is the source used when a person is playing.
+    Every loop reading input reads the held keys and the mouse position
+    before calling get_events, once per frame.
+
+    Attributes:
+        realtime (bool): True if a person is playing.  The frame rate is then
+            held at constants.GAME_FPS, and the game is saved on quitting.
+
+    '''
+
+    realtime = True
+
+    def get_events(self):
+
+        return pygame.event.get()
+
+    def get_pressed(self):
+
+        return pygame.key.get_pressed()
+
+    def get_mouse_pos(self):
+
+        return pygame.mouse.get_pos()
+
+    def close(self):
+
+        pass
+
+class obj_InputScript(object):
+
+    '''Input source that plays back a list of actions, one action per frame.
+
+    Used by headless games.  Each action becomes the KEYDOWN event the player
+    would have produced, once the actions run out a QUIT event ends the game.
+
+    Attributes:
+        actions (arg, list): action names, see ACTION_KEYS for the names known.
+        realtime (bool): always False, scripted games run as fast as possible.
+        actions_played (int): number of actions handed out so far.
+
+    '''
+
+    # action name -> (key, shift held)
+    ACTION_KEYS = {"up": (pygame.K_UP, False),
+                   "down": (pygame.K_DOWN, False),
+                   "left": (pygame.K_LEFT, False),
+                   "right": (pygame.K_RIGHT, False),
+                   "g": (pygame.K_g, False),
+                   "d": (pygame.K_d, False),
+                   "s": (pygame.K_s, False),
+                   ">": (pygame.K_PERIOD, True)}
+
+    realtime = False
+
+    def __init__(self, actions):
+
+        for action in actions:
+            if action not in self.ACTION_KEYS:
+                raise ValueError("unknown script action: " + repr(action))
+
+        self.actions = list(actions)
+        self.actions_played = 0
+
+    def get_events(self):
+
+        if self.actions_played >= len(self.actions):
+            return [pygame.event.Event(pygame.QUIT)]
+
+        key, shift = self.ACTION_KEYS[self.actions[self.actions_played]]
+        self.actions_played += 1
+
+        mod = pygame.KMOD_LSHIFT if shift else 0
+
+        return [pygame.event.Event(pygame.KEYDOWN, key = key, mod = mod)]
+
+    def get_pressed(self):
+
+        '''Returns the held keys for the action get_events hands out next.'''
+
+        pressed = collections.defaultdict(bool)
+
+        if self.actions_played < len(self.actions):
+            key, shift = self.ACTION_KEYS[self.actions[self.actions_played]]
+            pressed[pygame.K_LSHIFT] = shift
+
+        return pressed
+
+    def get_mouse_pos(self):
+
+        return (0, 0)
+
+    def close(self):
+
+        pass
+
+class obj_InputRecorder(object):
+
+    '''Input source that records the input of another source to a file.
+
+    The input is passed through unchanged, so the game plays as usual while it
+    is recorded.  Every call to get_events is a frame, and the frames where
+    something happened are written with the held keys and mouse position read
+    before get_events.  Runs of frames where nothing happened are written as
+    a count.  obj_InputReplay plays the file back.
+
+    The file is gzipped, one JSON value per line.  The first line is a header
+    holding the seed of the game, so the replay plays the same dungeon.
+
+    Attributes:
+        source (arg, obj_InputLive): where the input comes from.
+        file_name (arg, str): file the input is recorded to.
+        seed (arg, int): seed of the game being recorded, see obj_Game.
+        realtime (bool): same as the source's.
+
+    '''
+
+    # events the game reacts to, name -> (event type, attributes recorded)
+    EVENTS = {"KEYDOWN": (pygame.KEYDOWN, ("key", "mod")),
+              "MOUSEBUTTONDOWN": (pygame.MOUSEBUTTONDOWN, ("button", "pos")),
+              "QUIT": (pygame.QUIT, ())}
+
+    # held keys the game reacts to
+    HELD_KEYS = (pygame.K_LSHIFT, pygame.K_RSHIFT)
+
+    def __init__(self, source, file_name, seed):
+
+        self.source = source
+        self.realtime = source.realtime
+
+        self._file = gzip.open(file_name, 'wb')
+        self._idle = 0
+        self._pressed = None
+        self._mouse_pos = None
+
+        self._event_names = dict((event_type, (name, attributes))
+            for name, (event_type, attributes) in self.EVENTS.items())
+
+        self._write({"format": constants.REPLAY_MAGIC,
+                     "version": constants.REPLAY_VERSION,
+                     "seed": seed,
+                     "pygame": pygame.version.ver})
+
+    def get_events(self):
+
+        events = self.source.get_events()
+
+        recorded = []
+
+        for event in events:
+            if event.type in self._event_names:
+                name, attributes = self._event_names[event.type]
+                recorded.append([name] + [getattr(event, attribute)
+                                          for attribute in attributes])
+
+        if recorded:
+            self._write_idle()
+            self._write([recorded, self._pressed, self._mouse_pos])
+        else:
+            self._idle += 1
+
+        self._pressed = None
+        self._mouse_pos = None
+
+        return events
+
+    def get_pressed(self):
+
+        pressed = self.source.get_pressed()
+
+        self._pressed = [key for key in self.HELD_KEYS if pressed[key]]
+
+        return pressed
+
+    def get_mouse_pos(self):
+
+        mouse_pos = self.source.get_mouse_pos()
+
+        self._mouse_pos = list(mouse_pos)
+
+        return mouse_pos
+
+    def close(self):
+
+        '''Finishes the file, call once the game is over.'''
+
+        if self._file:
+            self._write_idle()
+            self._file.close()
+            self._file = None
+
+    def _write_idle(self):
+
+        if self._idle:
+            self._write(self._idle)
+            self._idle = 0
+
+    def _write(self, value):
+
+        line = json.dumps(value, separators = (",", ":")) + "\n"
+
+        self._file.write(line.encode("ascii"))
+
+class obj_InputReplay(object):
+
+    '''Input source that plays back a file written by obj_InputRecorder.
+
+    The frames are handed out as fast as the game asks for them.  Once they
+    run out a QUIT event ends the game.  The game must be started with the
+    recorded seed for the replay to play out the same.
+
+    Attributes:
+        file_name (arg, str): file the input was recorded to.
+        seed (int): seed of the recorded game.
+        realtime (bool): always False, replays run as fast as possible.
+        frames_played (int): number of frames handed out so far.
+
+    '''
+
+    realtime = False
+
+    def __init__(self, file_name):
+
+        with gzip.open(file_name, 'rb') as file:
+            lines = file.read().decode("ascii").splitlines()
+
+        header = json.loads(lines[0]) if lines else {}
+
+        if (header.get("format") != constants.REPLAY_MAGIC or
+                header.get("version") != constants.REPLAY_VERSION):
+            raise ValueError(file_name + " is not a replay this version "
+                             "of the game can play")
+
+        self.seed = header["seed"]
+        self.frames_played = 0
+
+        self._frames = [json.loads(line) for line in lines[1:]]
+        self._next = 0
+        self._idle = 0
+        self._mouse_pos = (0, 0)
+
+    def get_events(self):
+
+        self.frames_played += 1
+
+        if self._idle:
+            self._idle -= 1
+            return []
+
+        if self._next >= len(self._frames):
+            return [pygame.event.Event(pygame.QUIT)]
+
+        frame = self._frames[self._next]
+        self._next += 1
+
+        # a count of frames where nothing happened
+        if not isinstance(frame, list):
+            self._idle = frame - 1
+            return []
+
+        recorded, pressed, mouse_pos = frame
+
+        if mouse_pos:
+            self._mouse_pos = tuple(mouse_pos)
+
+        events = []
+
+        for values in recorded:
+            event_type, attributes = obj_InputRecorder.EVENTS[values[0]]
+            event_dict = dict(zip(attributes, values[1:]))
+
+            if "pos" in event_dict:
+                event_dict["pos"] = tuple(event_dict["pos"])
+
+            events.append(pygame.event.Event(event_type, event_dict))
+
+        return events
+
+    def get_pressed(self):
+
+        '''Returns the held keys of the frame get_events hands out next.'''
+
+        pressed = collections.defaultdict(bool)
+
+        frame = self._peek()
+
+        if frame and frame[1]:
+            for key in frame[1]:
+                pressed[key] = True
+
+        return pressed
+
+    def get_mouse_pos(self):
+
+        '''Returns the mouse position of the frame get_events hands out next.'''
+
+        frame = self._peek()
+
+        if frame and frame[2]:
+            return tuple(frame[2])
+
+        return self._mouse_pos
+
+    def close(self):
+
+        pass
+
+    def _peek(self):
+
+        if self._idle or self._next >= len(self._frames):
+            return None
+
+        frame = self._frames[self._next]
+
+        return frame if isinstance(frame, list) else None
+
+class obj_Camera:
+
+    def __init__(self):
+
+        self.width = constants.CAMERA_WIDTH
+        self.height = constants.CAMERA_HEIGHT
+        self.x, self.y = (0, 0)
+
+    @property
+    def rectangle(self):
+
+        pos_rect = pygame.Rect((0, 0), (constants.CAMERA_WIDTH,
+                                        constants.CAMERA_HEIGHT))
+
+        pos_rect.center = (self.x, self.y)
+
+        return pos_rect
+
+    @property
+    def map_address(self):
+
+        map_x = self.x / constants.CELL_WIDTH
+        map_y = self.y / constants.CELL_HEIGHT
+
+        return (map_x, map_y)
+
+    def update(self):
+
+        target_x = PLAYER.x * constants.CELL_WIDTH + (constants.CELL_WIDTH/2)
+        target_y = PLAYER.y * constants.CELL_HEIGHT + (constants.CELL_HEIGHT/2)
+
+        distance_x, distance_y = self.map_dist((target_x, target_y))
+
+        self.x += int(distance_x)
+        self.y += int(distance_y)
+
+    def win_to_map(self, coords):
+
+        tar_x, tar_y = coords
+
+        #convert window coords to distace from camera
+        cam_d_x, cam_d_y = self.cam_dist((tar_x, tar_y))
+
+        #distance from cam -> map coord
+        map_p_x = self.x + cam_d_x
+        map_p_y = self.y + cam_d_y
+
+        return((map_p_x, map_p_y))
+
+
+    def map_dist(self, coords):
+
+        new_x, new_y = coords
+
+        dist_x = new_x - self.x
+        dist_y = new_y - self.y
+
+        return (dist_x, dist_y)
+
+    def cam_dist(self, coords):
+
+        win_x, win_y = coords
+
+        dist_x = win_x - (self.width / 2)
+        dist_y = win_y - (self.height / 2)
+
+        return (dist_x, dist_y)
+
+class obj_Assets(object):
+
+    '''This class is a struct that holds all the assets used in the game. This
+    includes sprites, sound effects, and music.
+
+    Nothing is loaded up front.  The sprites are loaded the first time any of
+    them is used and each sound the first time it is played, so a run that
+    never draws or plays anything never loads them.  preload loads all of
+    them in a background thread, so they are ready by the time they are
+    needed.
+
+    Cutting and scaling the sprites out of their spritesheets is only done
+    when the spritesheets or SPRITES change.  The result is kept in an atlas,
+    a single image holding every sprite, in constants.ATLAS_FILE and loaded
+    from there the next time the game starts.
+
+    Attributes:
+        audio (arg, bool): if False, no sound or music is ever loaded or
+            played.
+        sounds (dict): the sound effects loaded so far, by name.
+
+    '''
+
+    # the spritesheets the sprites are cut from
+    SPRITESHEETS = {
+        "reptile": "data/graphics/Characters/Reptile.png",
+        "rodent": "data/graphics/Characters/Rodent.png",
+        "wall": "data/graphics/Objects/Wall.png",
+        "floor": "data/graphics/Objects/Floor.png",
+        "tile": "data/graphics/Objects/Tile.png",
+        "shield": "data/graphics/Items/Shield.png",
+        "medwep": "data/graphics/Items/MedWep.png",
+        "scroll": "data/graphics/Items/Scroll.png",
+        "flesh": "data/graphics/Items/Flesh.png",
+        "misc": "data/graphics/Items/Light.png",
+        "doors": "data/graphics/Objects/Door.png"
+    }
+
+    # size of a sprite within its spritesheet, sprites are scaled to a cell
+    SPRITE_SIZE = 16
+
+    # every sprite as (name, spritesheet, column, row, number of images)
+    SPRITES = [
+
+        ## ANIMATIONS ##
+        ("A_PLAYER", "reptile", 'o', 5, 2),
+        ("A_SNAKE_01", "reptile", 'e', 5, 2),
+        ("A_SNAKE_02", "reptile", 'k', 5, 2),
+        ("A_MOUSE", "rodent", 'a', 2, 2),
+
+        ## SPRITES ##
+        ("S_WALL", "wall", 'd', 7, 1),
+        ("S_WALLEXPLORED", "wall", 'd', 13, 1),
+        ("S_FLOOR", "floor", 'b', 8, 1),
+        ("S_FLOOREXPLORED", "floor", 'b', 14, 1),
+
+        ## ITEMS ##
+        ("S_SWORD", "medwep", 'a', 1, 1),
+        ("S_SHIELD", "shield", 'a', 1, 1),
+        ("S_SCROLL_01", "scroll", 'e', 1, 1),
+        ("S_SCROLL_02", "scroll", 'c', 2, 1),
+        ("S_SCROLL_03", "scroll", 'd', 6, 1),
+        ("S_FLESH_01", "flesh", 'b', 4, 1),
+        ("S_FLESH_02", "flesh", 'a', 1, 1),
+
+        ## SPECIAL ##
+        ("S_STAIRS_DOWN", "tile", 'f', 4, 1),
+        ("S_STAIRS_UP", "tile", 'e', 4, 1),
+        ("S_MAGIC_LAMP", "misc", 'e', 1, 1),
+        ("S_PORTALCLOSED", "doors", 'j', 6, 1),
+        ("S_PORTALOPEN", "doors", 'k', 6, 2)
+
+    ]
+
+    # sprites drawn as a single image rather than a list of them
+    SINGLE_IMAGES = ("S_WALL", "S_WALLEXPLORED", "S_FLOOR", "S_FLOOREXPLORED")
+
+    # every sound effect, by name
+    SOUNDS = {
+        "snd_hit_1": "data/audio/Hit_1.wav",
+        "snd_hit_2": "data/audio/Hit_2.wav",
+        "snd_hit_3": "data/audio/Hit_3.wav",
+        "snd_hit_4": "data/audio/Hit_4.wav"
+    }
+
+    def __init__(self, audio = True):
+
+        self.audio = audio
+        self.sounds = {}
+
+        self.music_background = "data/audio/Our First Hours.mp3"
+
+        # sound list for player hitting creature
+        self.snd_list_hit = ["snd_hit_1",
+                             "snd_hit_2",
+                             "snd_hit_3",
+                             "snd_hit_4"]
+
+        # held while loading, preload loads from another thread
+        self._lock = threading.RLock()
+        self._preload_thread = None
+
+        self.volume_adjust()
+
+    def __getattr__(self, name):
+
+        # only called for attributes that are not there yet
+        if name == "animation_dict" or name in [sprite[0]
+                                                for sprite in self.SPRITES]:
+            self.sprites_load()
+        elif name == "MAIN_MENU_BG":
+            self.menu_load()
+        else:
+            raise AttributeError(name)
+
+        return self.__dict__[name]
+
+    def preload(self):
+
+        '''Starts loading every asset in a background thread.'''
+
+        if self._preload_thread:
+            return
+
+        self._preload_thread = threading.Thread(target = self._preload)
+        self._preload_thread.daemon = True
+        self._preload_thread.start()
+
+    def _preload(self):
+
+        # the main menu is the first thing to need its background
+        self.menu_load()
+        self.sprites_load()
+
+        if self.audio:
+            for name in self.SOUNDS:
+                self.sound(name)
+
+    def sprites_load(self):
+
+        '''Loads every sprite, from the atlas if it is up to date.'''
+
+        with self._lock:
+            if "animation_dict" in self.__dict__:
+                return
+
+            sprites = self.atlas_load()
+
+            if sprites is None:
+                sprites = self.atlas_build()
+
+            loaded = dict(sprites)
+
+            for name in self.SINGLE_IMAGES:
+                loaded[name] = sprites[name][0]
+
+            loaded["animation_dict"] = dict((name, images)
+                for name, images in sprites.items()
+                if name not in self.SINGLE_IMAGES)
+
+            # all at once, so no other thread sees half of the sprites
+            self.__dict__.update(loaded)
+
+    def menu_load(self):
+
+        '''Loads the background of the main menu.'''
+
+        with self._lock:
+            if "MAIN_MENU_BG" in self.__dict__:
+                return
+
+            image = pygame.image.load("data/graphics/snake_menu.jpg")
+
+            self.MAIN_MENU_BG = pygame.transform.scale(image,
+                (constants.CAMERA_WIDTH, constants.CAMERA_HEIGHT))
+
+    def atlas_source(self):
+
+        '''Describes what the atlas is built from.
+
+        The atlas is only loaded if the description stored with it matches
+        this one, so editing a spritesheet or SPRITES builds it again.
 
-    def intersect(self, other):
+        Returns:
+            source (dict): the atlas version, SPRITES, and a checksum of the
+                contents of each spritesheet.
 
-        # return True if other obj intersects with this one
-        objects_intersect = (self.x1 <= other.x2 and self.x2 >= other.x1 and
-                             self.y1 <= other.y2 and self.y2 >= other.y1)
+        '''
 
-        return objects_intersect
+        checksums = {}
 
-class obj_Camera:
+        for sheet, file_name in self.SPRITESHEETS.items():
+            with open(file_name, 'rb') as file:
+                checksums[sheet] = zlib.crc32(file.read()) & 0xFFFFFFFF
 
-    def __init__(self):
+        source = {"version": constants.ATLAS_VERSION,
+                  "cell": [constants.CELL_WIDTH, constants.CELL_HEIGHT],
+                  "sprites": self.SPRITES,
+                  "spritesheets": checksums}
 
-        self.width = constants.CAMERA_WIDTH
-        self.height = constants.CAMERA_HEIGHT
-        self.x, self.y = (0, 0)
+        # compared with the copy read back from the index file
+        return json.loads(json.dumps(source))
 
-    @property
-    def rectangle(self):
+    def atlas_load(self):
 
-        pos_rect = pygame.Rect((0, 0), (constants.CAMERA_WIDTH,
-                                        constants.CAMERA_HEIGHT))
+        '''Loads the sprites from the atlas.
 
-        pos_rect.center = (self.x, self.y)
+        Returns:
+            sprites (dict): maps each name in SPRITES to its list of images,
+                or None if there is no atlas or it is out of date.
 
-        return pos_rect
+        '''
 
-    @property
-    def map_address(self):
+        try:
+            with open(constants.ATLAS_INDEX_FILE, 'r') as file:
+                index = json.load(file)
 
-        map_x = self.x / constants.CELL_WIDTH
-        map_y = self.y / constants.CELL_HEIGHT
+            if index["source"] != self.atlas_source():
+                return None
 
-        return (map_x, map_y)
+            atlas = pygame.image.load(constants.ATLAS_FILE).convert()
 
-    def update(self):
+        except (IOError, OSError, ValueError, KeyError, pygame.error):
+            return None
 
-        target_x = PLAYER.x * constants.CELL_WIDTH + (constants.CELL_WIDTH/2)
-        target_y = PLAYER.y * constants.CELL_HEIGHT + (constants.CELL_HEIGHT/2)
+        sprites = {}
 
-        distance_x, distance_y = self.map_dist((target_x, target_y))
+        for name, rects in index["sprites"].items():
+            sprites[str(name)] = []
 
-        self.x += int(distance_x)
-        self.y += int(distance_y)
+            for rect in rects:
+                image = atlas.subsurface(rect).copy()
+                image.set_colorkey(constants.COLOR_BLACK)
 
-    def win_to_map(self, coords):
+                sprites[str(name)].append(image)
 
-        tar_x, tar_y = coords
+        return sprites
 
-        #convert window coords to distace from camera
-        cam_d_x, cam_d_y = self.cam_dist((tar_x, tar_y))
+    def atlas_build(self):
 
-        #distance from cam -> map coord
-        map_p_x = self.x + cam_d_x
-        map_p_y = self.y + cam_d_y
+        '''Cuts every sprite out of its spritesheet and saves the atlas.
 
-        return((map_p_x, map_p_y))
+        Each sprite gets a row of the atlas, one cell per image.  The atlas is
+        a cache, so failing to write it only means it is built again next
+        time.
 
+        Returns:
+            sprites (dict): maps each name in SPRITES to its list of images.
 
-    def map_dist(self, coords):
+        '''
 
-        new_x, new_y = coords
+        spritesheets = dict((sheet, obj_Spritesheet(file_name))
+                            for sheet, file_name in self.SPRITESHEETS.items())
 
-        dist_x = new_x - self.x
-        dist_y = new_y - self.y
+        sprites = {}
+        rects = {}
 
-        return (dist_x, dist_y)
+        for row, (name, sheet, column, sheet_row, num_sprites) in enumerate(
+                self.SPRITES):
+            sprites[name] = spritesheets[sheet].get_animation(column,
+                sheet_row, self.SPRITE_SIZE, self.SPRITE_SIZE, num_sprites,
+                (constants.CELL_WIDTH, constants.CELL_HEIGHT))
 
-    def cam_dist(self, coords):
+            rects[name] = [[i * constants.CELL_WIDTH,
+                            row * constants.CELL_HEIGHT,
+                            constants.CELL_WIDTH, constants.CELL_HEIGHT]
+                           for i in range(num_sprites)]
 
-        win_x, win_y = coords
+        atlas_width = max(num_sprites for (name, sheet, column, sheet_row,
+                          num_sprites) in self.SPRITES) * constants.CELL_WIDTH
+        atlas_height = len(self.SPRITES) * constants.CELL_HEIGHT
 
-        dist_x = win_x - (self.width / 2)
-        dist_y = win_y - (self.height / 2)
+        atlas = pygame.Surface((atlas_width, atlas_height)).convert()
+        atlas.fill(constants.COLOR_BLACK)
 
-        return (dist_x, dist_y)
+        for name, images in sprites.items():
+            for image, rect in zip(images, rects[name]):
+                atlas.blit(image, rect[:2])
 
-class obj_Assets:
+        index = {"source": self.atlas_source(), "sprites": rects}
 
-    '''This class is a struct that holds all the assets used in the game. This
-    includes sprites, sound effects, and music.
+        try:
+            cache_dir = os.path.dirname(constants.ATLAS_FILE)
 
-    '''
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
 
-    def __init__(self):
+            pygame.image.save(atlas, constants.ATLAS_FILE)
 
-        # complete sound list
-        self.snd_list = []
+            # written last, an atlas without its index is never loaded
+            with open(constants.ATLAS_INDEX_FILE, 'w') as file:
+                json.dump(index, file, indent = 1, sort_keys = True)
 
-        self.load_assets()
+        except (IOError, OSError, pygame.error):
+            pass
 
-        self.volume_adjust()
+        return sprites
 
-    def load_assets(self):
-
-        #########
-        ## ART ##
-        #########
-
-        ## SPRITESHEETS ##
-        self.reptile = obj_Spritesheet("data/graphics/Characters/Reptile.png")
-        self.aquatic = obj_Spritesheet("data/graphics/Characters/Aquatic.png")
-        self.rodent = obj_Spritesheet("data/graphics/Characters/Rodent.png")
-        self.wall = obj_Spritesheet("data/graphics/Objects/Wall.png")
-        self.floor = obj_Spritesheet("data/graphics/Objects/Floor.png")
-        self.tile = obj_Spritesheet("data/graphics/Objects/Tile.png")
-        self.shield = obj_Spritesheet("data/graphics/Items/Shield.png")
-        self.medwep = obj_Spritesheet("data/graphics/Items/MedWep.png")
-        self.scroll = obj_Spritesheet("data/graphics/Items/Scroll.png")
-        self.flesh = obj_Spritesheet("data/graphics/Items/Flesh.png")
-        self.misc = obj_Spritesheet("data/graphics/Items/Light.png")
-        self.doors = obj_Spritesheet('data/graphics/Objects/Door.png')
+    def sound(self, name):
 
-        ## ANIMATIONS ##
-        self.A_PLAYER = self.reptile.get_animation('o', 5, 16, 16, 2, (32, 32))
-        self.A_SNAKE_01 = self.reptile.get_animation('e', 5, 16, 16, 2, (32, 32))
-        self.A_SNAKE_02 = self.reptile.get_animation('k', 5, 16, 16, 2, (32, 32))
-        self.A_MOUSE = self.rodent.get_animation('a', 2, 16, 16, 2, (32, 32))
+        '''Returns the sound effect called name, loading it on first use.'''
 
-        ## SPRITES ##
-        self.S_WALL = self.wall.get_image('d', 7, 16, 16, (32, 32))[0]
-        self.S_WALLEXPLORED = self.wall.get_image('d', 13, 16, 16, (32, 32))[0]
+        with self._lock:
+            new_sound = self.sounds.get(name)
 
-        self.S_FLOOR = self.floor.get_image('b', 8, 16, 16, (32, 32))[0]
-        self.S_FLOOREXPLORED = self.floor.get_image('b', 14, 16, 16, (32, 32))[0]
+            if new_sound is None:
+                new_sound = pygame.mixer.Sound(self.SOUNDS[name])
+                new_sound.set_volume(PREFERENCES.vol_sound)
 
-        ## ITEMS ##
-        self.S_SWORD = self.medwep.get_image('a', 1, 16, 16, (32, 32))
-        self.S_SHIELD = self.shield.get_image('a', 1, 16, 16, (32, 32))
-        self.S_SCROLL_01 = self.scroll.get_image('e', 1, 16, 16, (32, 32))
-        self.S_SCROLL_02 = self.scroll.get_image('c', 2, 16, 16, (32, 32))
-        self.S_SCROLL_03 = self.scroll.get_image('d', 6, 16, 16, (32, 32))
-        self.S_FLESH_01 = self.flesh.get_image('b', 4, 16, 16, (32, 32))
-        self.S_FLESH_02 = self.flesh.get_image('a', 1, 16, 16, (32, 32))
+                self.sounds[name] = new_sound
 
-        ## SPECIAL ##
-        self.S_STAIRS_DOWN = self.tile.get_image('f', 4, 16, 16, (32, 32))
-        self.S_STAIRS_UP = self.tile.get_image('e', 4, 16, 16, (32, 32))
-        self.MAIN_MENU_BG = pygame.image.load("data/graphics/snake_menu.jpg")
-        self.MAIN_MENU_BG = pygame.transform.scale(self.MAIN_MENU_BG,
-                              (constants.CAMERA_WIDTH, constants.CAMERA_HEIGHT))
-        self.S_MAGIC_LAMP = self.misc.get_image('e', 1, 16, 16, (32, 32))
-        self.S_PORTALCLOSED = self.doors.get_image('j', 6, 16, 16, (32, 32))
-        self.S_PORTALOPEN = self.doors.get_animation('k', 6, 16, 16, 2, (32, 32))
-
-        self.animation_dict = {
-
-            ## ANIMATIONS ##
-            "A_PLAYER" : self.A_PLAYER,
-            "A_SNAKE_01" : self.A_SNAKE_01,
-            "A_SNAKE_02" : self.A_SNAKE_02,
-            "A_MOUSE" : self.A_MOUSE,
-
-            ## ITEMS ##
-            "S_SWORD" : self.S_SWORD,
-            "S_SHIELD" : self.S_SHIELD,
-            "S_SCROLL_01" : self.S_SCROLL_01,
-            "S_SCROLL_02" : self.S_SCROLL_02,
-            "S_SCROLL_03" : self.S_SCROLL_03,
-            "S_FLESH_01" : self.S_FLESH_01,
-            "S_FLESH_02" : self.S_FLESH_02,
-
-            ## SPECIAL ##
-            "S_STAIRS_DOWN" : self.S_STAIRS_DOWN,
-            "S_STAIRS_UP" : self.S_STAIRS_UP,
-            "S_MAGIC_LAMP" : self.S_MAGIC_LAMP,
-            "S_PORTALCLOSED" : self.S_PORTALCLOSED,
-            "S_PORTALOPEN" : self.S_PORTALOPEN
-
-        }
-
-        ###########
-        ## AUDIO ##
-        ###########
-
-        # loaded sound assets
-        self.music_background = "data/audio/Our First Hours.mp3"
-        self.snd_hit_1 = self.sound_add("data/audio/hit_1.wav")
-        self.snd_hit_2 = self.sound_add("data/audio/hit_2.wav")
-        self.snd_hit_3 = self.sound_add("data/audio/hit_3.wav")
-        self.snd_hit_4 = self.sound_add("data/audio/hit_4.wav")
+        return new_sound
 
-        # sound list for player hitting creature
-        self.snd_list_hit = [ self.snd_hit_1,
-                              self.snd_hit_2,
-                              self.snd_hit_3,
-                              self.snd_hit_4 ]
+    def sound_play(self, name):
 
-    def sound_add(self, file_address):
+        if self.audio:
+            self.sound(name).play()
 
-        new_sound = pygame.mixer.Sound(file_address)
+    def music_play(self, file_name):
 
-        self.snd_list.append(new_sound)
+        if self.audio:
+            pygame.mixer.music.load(file_name)
+            pygame.mixer.music.play(-1)
 
-        return new_sound
+    def music_stop(self):
+
+        if self.audio:
+            pygame.mixer.music.stop()
 
     def volume_adjust(self):
 
-        for sound in self.snd_list:
-            sound.set_volume(PREFERENCES.vol_sound)
+        if not self.audio:
+            return
+
+        with self._lock:
+            for sound in self.sounds.values():
+                sound.set_volume(PREFERENCES.vol_sound)
 
         pygame.mixer.music.set_volume(PREFERENCES.vol_music)
 
@@ -657,20 +3045,39 @@ class com_Creature:
         name_instance (arg, str): name of instance. "Bob" for example.
         max_hp (arg, int): max health of the creature.
         death_function (arg, function): function to be executed when hp reaches 0.
+        speed (arg, int): how quick the creature is, a creature with twice
+            constants.SPEED_NORMAL takes two turns for every normal turn.
         current_hp (int): current health of the creature.
 
+    power and defense are worked out from the base stats and the equipped
+    items once, then cached until stats_invalidate is called.
+
     '''
 
+    # creatures saved before speeds existed
+    speed = constants.SPEED_NORMAL
+
+    # (power, defense) once worked out, see stats_invalidate
+    _stats = None
+
     def __init__(self, name_instance, base_atk = 2, base_def = 0, max_hp = 10,
-        death_function = None):
+        death_function = None, speed = constants.SPEED_NORMAL):
 
         self.name_instance = name_instance
         self.base_atk = base_atk
         self.base_def = base_def
         self.max_hp = max_hp
         self.death_function = death_function
+        self.speed = speed
         self.current_hp = max_hp
 
+    @property
+    def action_delay(self):
+
+        '''Game time that passes between two turns of this creature.'''
+
+        return constants.TURN_ACTION_COST * constants.SPEED_NORMAL // self.speed
+
     def move(self, dx, dy):
 
         '''Moves the object
@@ -681,8 +3088,8 @@ class com_Creature:
 
         '''
 
-        tile_is_wall = (GAME.current_map[self.owner.x + dx]
-                        [self.owner.y + dy].block_path == True)
+        tile_is_wall = GAME.current_map.block_path[self.owner.x + dx,
+                                                   self.owner.y + dy]
 
         target = map_check_for_creature(self.owner.x + dx,
                                         self.owner.y + dy,
@@ -715,8 +3122,10 @@ class com_Creature:
 
         target.creature.take_damage(damage_delt)
 
+        map_make_noise((self.owner.x, self.owner.y), constants.NOISE_ATTACK)
+
         if damage_delt > 0 and self.owner is PLAYER:
-            pygame.mixer.Sound.play(RANDOM_ENGINE.choice(ASSETS.snd_list_hit))
+            ASSETS.sound_play(GAME.random.combat.choice(ASSETS.snd_list_hit))
 
 
     def take_damage(self, damage):
@@ -758,32 +3167,42 @@ class com_Creature:
     @property
     def power(self):
 
-        total_power = self.base_atk
+        return self._stats_get()[0]
 
-        if self.owner.container:
-            object_bonuses = [obj.equipment.attack_bonus
-                                for obj in self.owner.container.equipped_items]
+    @property
+    def defense(self):
 
-            for bonus in object_bonuses:
-                if bonus:
-                    total_power += bonus
+        return self._stats_get()[1]
 
-        return total_power
+    def stats_invalidate(self):
 
-    @property
-    def defense(self):
+        '''Drops the cached power and defense.
+
+        Must be called whenever something they are worked out from changes:
+        the base stats, what is equipped, what is in the inventory, or
+        anything else that adds to them later on.
+
+        '''
 
-        total_defense = self.base_def
+        self._stats = None
 
-        if self.owner.container:
-            object_bonuses = [obj.equipment.defense_bonus
-                                for obj in self.owner.container.equipped_items]
+    def _stats_get(self):
 
-            for bonus in object_bonuses:
-                if bonus:
-                    total_defense += bonus
+        if self._stats is None:
+            total_power = self.base_atk
+            total_defense = self.base_def
 
-        return total_defense
+            if self.owner.container:
+                for obj in self.owner.container.equipped_items:
+                    if obj.equipment.attack_bonus:
+                        total_power += obj.equipment.attack_bonus
+
+                    if obj.equipment.defense_bonus:
+                        total_defense += obj.equipment.defense_bonus
+
+            self._stats = (total_power, total_defense)
+
+        return self._stats
 
 class com_Container:
 
@@ -810,6 +3229,14 @@ class com_Container:
 
         return list_of_equipped_items
 
+    def inventory_changed(self):
+
+        '''Call after the inventory or what is equipped changes, the stats of
+        the holder depend on both.'''
+
+        if self.owner.creature:
+            self.owner.creature.stats_invalidate()
+
 
     ## TODO Get weight of everything in inventory
 
@@ -860,11 +3287,12 @@ class com_Item:
 
                 # add to actor inventory
                 actor.container.inventory.append(self.owner)
+                actor.container.inventory_changed()
 
                 self.owner.animation_destroy()
 
                 # remove from game active list
-                GAME.current_objects.remove(self.owner)
+                GAME.remove_object(self.owner)
 
                 # tell item what container holds it
                 self.current_container = actor.container
@@ -883,17 +3311,19 @@ class com_Item:
 
         '''
 
+        # set item location to as defined in the args
+        self.owner.x = new_x
+        self.owner.y = new_y
+
         # add this item to tracked objects
-        GAME.current_objects.append(self.owner)
+        GAME.add_object(self.owner)
 
         self.owner.animation_init()
 
         # remove from the inventory of whatever actor holds it
         self.current_container.inventory.remove(self.owner)
-
-        # set item location to as defined in the args
-        self.owner.x = new_x
-        self.owner.y = new_y
+        self.current_container.inventory_changed()
+        self.current_container = None
 
         # confirm successful placement with game message
         game_message("Item Dropped!")
@@ -916,6 +3346,7 @@ class com_Item:
 
             else:
                 self.current_container.inventory.remove(self.owner)
+                self.current_container.inventory_changed()
 
 class com_Equipment:
 
@@ -945,12 +3376,14 @@ class com_Equipment:
                 return
 
         self.equipped = True
+        self.owner.item.current_container.inventory_changed()
 
         game_message("item equipped")
 
     def unequip(self):
         #toggle self.equipped
         self.equipped = False
+        self.owner.item.current_container.inventory_changed()
 
         game_message("item unequipped")
 
@@ -999,6 +3432,10 @@ class com_Exitportal:
 
             PLAYER.state = "STATUS_WIN"
 
+            # scripted and replayed games are summed up by their caller
+            if not INPUT.realtime:
+                return
+
             SURFACE_MAIN.fill(constants.COLOR_WHITE)
 
             screen_center = (constants.CAMERA_WIDTH/2, constants.CAMERA_HEIGHT/2)
@@ -1011,16 +3448,16 @@ class com_Exitportal:
 
             pygame.display.update()
 
-            filename = ("data\winrecord_" +
+            filename = ("data/winrecord_" +
                         PLAYER.creature.name_instance + "." +
                         datetime.date.today().strftime("%Y%B%d") +
                         ".txt")
 
             file_exists = os.path.isfile(filename)
-            save_exists = os.path.isfile("data\savegame")
+            save_exists = os.path.isfile("data/savegame")
 
             if file_exists: os.remove(filename)
-            if save_exists: os.remove("data\savegame")
+            if save_exists: os.remove("data/savegame")
 
             legacy_file = open(filename, 'a+')
 
@@ -1053,8 +3490,8 @@ class ai_Confuse:
     def take_turn(self):
 
         if self.num_turns > 0:
-            self.owner.creature.move(libtcod.random_get_int(0, -1, 1),
-                libtcod.random_get_int(0, -1, 1))
+            self.owner.creature.move(GAME.random.ai.randint(-1, 1),
+                                     GAME.random.ai.randint(-1, 1))
 
             self.num_turns -= 1
 
@@ -1069,32 +3506,133 @@ class ai_Chase:
 
     '''
 
+    # turns left to hunt for the player out of sight, set by map_make_noise
+    alert = 0
+
+    # obj_PathCache, created the first time the player is out of CHASE_FIELD
+    path = None
+
     def take_turn(self):
 
         monster = self.owner
 
-        if libtcod.map_is_in_fov(FOV_MAP, monster.x, monster.y):
+        # out of sight the monster sleeps until the player can see it, unless
+        # a noise has it looking for the player
+        if not libtcod.map_is_in_fov(FOV_MAP, monster.x, monster.y):
+            if not self.alert:
+                GAME.scheduler.sleep(monster)
+                return
+
+            self.alert -= 1
+
+        # move towards the player if far away
+        if monster.distance_to(PLAYER) >= 2:
+            self.chase()
+
+        # if close enough, attack player
+        elif PLAYER.creature.current_hp > 0:
+            monster.creature.attack(PLAYER)
+
+    def chase(self):
+
+        '''Takes a step along the shortest path to the player.
+
+        The path comes from CHASE_FIELD, shared by every chasing monster.  If
+        every step closer is taken by another creature the monster waits.
+        Outside the field the monster keeps a route of its own, and if that
+        is blocked by a creature it heads straight for the player.
+
+        '''
+
+        monster = self.owner
+
+        CHASE_FIELD.update(GAME.current_map, PLAYER.x, PLAYER.y)
+
+        steps = CHASE_FIELD.steps_towards(monster.x, monster.y)
+
+        if not steps:
+            if self.path is None:
+                self.path = obj_PathCache()
 
-            # move towards the player if far away
-            if monster.distance_to(PLAYER) >= 2:
-                self.owner.move_towards(PLAYER)
+            step = self.path.next_step(GAME.current_map, monster.x, monster.y,
+                                       PLAYER.x, PLAYER.y)
+
+            if (step is None or
+                    map_check_for_creature(monster.x + step[0],
+                                           monster.y + step[1])):
+                monster.move_towards(PLAYER)
+            else:
+                monster.creature.move(*step)
+
+            return
 
-            # if close enough, attack player
-            elif PLAYER.creature.current_hp > 0:
-                monster.creature.attack(PLAYER)
+        for dx, dy in steps:
+            if not map_check_for_creature(monster.x + dx, monster.y + dy):
+                monster.creature.move(dx, dy)
+                return
 
 class ai_Flee:
-    ''' A basic monster ai which chases and tries to harm player.
+    ''' A basic monster ai which runs from the player.
 
     '''
 
+    # obj_PathCache, created on the first turn
+    path = None
+
+    # turns left to run from the player out of sight, set by map_make_noise
+    alert = 0
+
     def take_turn(self):
 
         monster = self.owner
 
-        if libtcod.map_is_in_fov(FOV_MAP, monster.x, monster.y):
+        # out of sight the monster sleeps until the player can see it, unless
+        # a noise has it running from the player
+        if not libtcod.map_is_in_fov(FOV_MAP, monster.x, monster.y):
+            if not self.alert:
+                GAME.scheduler.sleep(monster)
+                return
+
+            self.alert -= 1
+
+        self.flee()
+
+    def flee(self):
+
+        '''Runs for the center of the room farthest from the player.
+
+        The route is kept between turns.  Once there, if the way is blocked by
+        a creature, or if the route leads past the player, the monster just
+        steps away from the player.
+
+        '''
+
+        monster = self.owner
+
+        if self.path is None:
+            self.path = obj_PathCache()
+
+        goal_x, goal_y = map_find_farthest_room((PLAYER.x, PLAYER.y))
 
-            self.owner.move_away(PLAYER)
+        step = self.path.next_step(GAME.current_map, monster.x, monster.y,
+                                   goal_x, goal_y)
+
+        if step is not None:
+            step_x = monster.x + step[0]
+            step_y = monster.y + step[1]
+
+            # the route to the room can lead past the player
+            if ((step_x - PLAYER.x) ** 2 + (step_y - PLAYER.y) ** 2 <
+                    (monster.x - PLAYER.x) ** 2 + (monster.y - PLAYER.y) ** 2):
+                step = None
+
+        if (step is None or
+                map_check_for_creature(monster.x + step[0],
+                                       monster.y + step[1])):
+            monster.move_away(PLAYER)
+            return
+
+        monster.creature.move(*step)
 
 
 #  ____             _   _
@@ -1114,8 +3652,8 @@ def death_snake(monster):
                  constants.COLOR_GREY)
 
     # remove ai and creature components
-    monster.animation = ASSETS.S_FLESH_01
     monster.animation_key = "S_FLESH_01"
+    monster.animation_init()
     monster.depth = constants.DEPTH_CORPSE
     monster.creature = None
     monster.ai = None
@@ -1128,8 +3666,8 @@ def death_mouse(mouse):
                  constants.COLOR_GREEN)
 
     # remove ai and creature components
-    mouse.animation = ASSETS.S_FLESH_02
     mouse.animation_key = "S_FLESH_02"
+    mouse.animation_init()
     mouse.depth = constants.DEPTH_CORPSE
     mouse.creature = None
     mouse.ai = None
@@ -1137,6 +3675,10 @@ def death_mouse(mouse):
 def death_player(player):
     player.state = "STATUS_DEAD"
 
+    # scripted and replayed games are summed up by their caller
+    if not INPUT.realtime:
+        return
+
     SURFACE_MAIN.fill(constants.COLOR_BLACK)
 
     screen_center = (constants.CAMERA_WIDTH/2, constants.CAMERA_HEIGHT/2)
@@ -1149,17 +3691,17 @@ def death_player(player):
 
     pygame.display.update()
 
-    filename = ("data\legacy_" +
+    filename = ("data/legacy_" +
                 PLAYER.creature.name_instance + "." +
                 datetime.date.today().strftime("%Y%B%d") +
                 ".txt")
 
 
     file_exists = os.path.isfile(filename)
-    save_exists = os.path.isfile("data\savegame")
+    save_exists = os.path.isfile("data/savegame")
 
     if file_exists: os.remove(filename)
-    if save_exists: os.remove("data\savegame")
+    if save_exists: os.remove("data/savegame")
 
     legacy_file = open(filename, 'a+')
 
@@ -1179,37 +3721,41 @@ def death_player(player):
 # |_|  |_|\__,_| .__/
 #              |_|
 
-def map_create():
+def map_create(rng = None):
 
     '''Creates the default map.
 
     Currently, the map this function creatures is a small room with 2 pillars
     within it.  It is a testing map.
 
+    Args:
+        rng (random.Random, optional): generator the map is rolled with,
+            GAME.random.mapgen if not included.
+
     Returns:
-        new_map (array): This array is populated with struc_Tile objects.
+        new_map (struc_TileGrid): the tiles of the new map.
 
     Effects:
-        Calls map_make_fov on new_map to preemptively create the fov.
+        Calls map_make_fov on new_map to preemptively create its fov map.
 
     '''
 
+    if rng is None:
+        rng = GAME.random.mapgen
+
     # initializes an empty map
-    new_map = [[struc_Tile(True) for y in range(0, constants.MAP_HEIGHT)]
-                                    for x in range(0, constants.MAP_WIDTH)]
+    new_map = struc_TileGrid(constants.MAP_WIDTH, constants.MAP_HEIGHT)
 
     # generate new room
     list_of_rooms = []
 
     for i in range(constants.MAP_MAX_NUM_ROOMS):
 
-        w = libtcod.random_get_int(0, constants.ROOM_MIN_WIDTH,
-                                      constants.ROOM_MAX_WIDTH)
-        h = libtcod.random_get_int(0, constants.ROOM_MIN_HEIGHT,
-                                      constants.ROOM_MAX_HEIGHT)
+        w = rng.randint(constants.ROOM_MIN_WIDTH, constants.ROOM_MAX_WIDTH)
+        h = rng.randint(constants.ROOM_MIN_HEIGHT, constants.ROOM_MAX_HEIGHT)
 
-        x = libtcod.random_get_int(0, 2, constants.MAP_WIDTH - w - 2)
-        y = libtcod.random_get_int(0, 2, constants.MAP_HEIGHT - h - 2)
+        x = rng.randint(2, constants.MAP_WIDTH - w - 2)
+        y = rng.randint(2, constants.MAP_HEIGHT - h - 2)
 
         #create the room
         new_room = obj_Room((x, y), (w, h))
@@ -1232,82 +3778,113 @@ def map_create():
                 previous_center = list_of_rooms[-1].center
 
                 # dig tunnels
-                map_create_tunnels(current_center, previous_center, new_map)
+                map_create_tunnels(current_center, previous_center, new_map,
+                                   rng)
 
             list_of_rooms.append(new_room)
 
-    # create FOV_MAP
-    map_make_fov(new_map)
+    # create the fov map, map_load_fov makes it the FOV_MAP
+    new_map.fov_map = map_make_fov(new_map)
 
     # returns the created map
     return (new_map, list_of_rooms)
 
-def map_place_objects(room_list):
+def map_from_tiles(tiles):
+
+    '''Builds a struc_TileGrid out of a map saved as a list of tile columns.
+
+    Args:
+        tiles (list): columns of struc_Tile, indexed tiles[x][y].
+
+    Returns:
+        new_map (struc_TileGrid): a grid holding the same tiles.
+
+    '''
+
+    new_map = struc_TileGrid(len(tiles), len(tiles[0]))
+
+    new_map.block_path[:] = [[tile.block_path for tile in column]
+                             for column in tiles]
+    new_map.explored[:] = [[tile.explored for tile in column]
+                           for column in tiles]
+
+    return new_map
+
+def map_place_objects(room_list, current_level, streams):
+
+    '''Creates the actors that populate a new level.
+
+    Args:
+        room_list (list): the rooms of the level, as returned by map_create.
+        current_level (int): depth of the level, the top level is 1.
+        streams (obj_RandomStreams): the actors are placed and rolled with
+            its mapgen, loot and names streams.
+
+    Returns:
+        level_objects (list): the new actors, not including the player.
+        player_coords ((int, int)): where the player starts on the level.
 
-    current_level = len(GAME.maps_previous) + 1
+    '''
 
     top_level = (current_level == 1)
     final_level = (current_level == constants.MAP_NUM_LEVELS)
 
+    level_objects = []
+
     for room in room_list:
 
         first_room = (room == room_list[0])
         last_room = (room == room_list[-1])
 
-        if first_room: PLAYER.x, PLAYER.y = room.center
+        if first_room: player_coords = room.center
 
         if first_room and top_level:
-            gen_portal(room.center)
+            level_objects.append(gen_portal(room.center))
 
         if first_room and not top_level:
-            gen_stairs((PLAYER.x, PLAYER.y), downwards = False)
+            level_objects.append(gen_stairs(player_coords, downwards = False))
 
 
         if last_room:
             if final_level:
-                gen_LAMP(room.center)
+                level_objects.append(gen_LAMP(room.center))
             else:
-                gen_stairs(room.center)
+                level_objects.append(gen_stairs(room.center))
+
 
 
+        x = streams.mapgen.randint(room.x1 + 1, room.x2 - 1)
+        y = streams.mapgen.randint(room.y1 + 1, room.y2 - 1)
 
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        level_objects.append(gen_enemy((x, y), streams))
 
-        gen_enemy((x, y))
+        x = streams.loot.randint(room.x1 + 1, room.x2 - 1)
+        y = streams.loot.randint(room.y1 + 1, room.y2 - 1)
 
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        level_objects.append(gen_item((x, y), streams))
 
-        gen_item((x, y))
+    return level_objects, player_coords
 
 def map_create_room(new_map, new_room):
-    for x in range(new_room.x1, new_room.x2):
-        for y in range(new_room.y1, new_room.y2):
-            new_map[x][y].block_path = False
+    new_map.block_path[new_room.x1:new_room.x2,
+                       new_room.y1:new_room.y2] = False
 
-def map_create_tunnels(coords1, coords2, new_map):
+def map_create_tunnels(coords1, coords2, new_map, rng):
 
-    coin_flip = (libtcod.random_get_int(0, 0, 1) == 1)
+    coin_flip = (rng.randint(0, 1) == 1)
 
     x1, y1 = coords1
     x2, y2 = coords2
 
     if coin_flip:
 
-        for x in range(min(x1, x2), max(x1, x2) + 1):
-            new_map[x][y1].block_path = False
-
-        for y in range(min(y1, y2), max(y1, y2) + 1):
-            new_map[x2][y].block_path = False
+        new_map.block_path[min(x1, x2):max(x1, x2) + 1, y1] = False
+        new_map.block_path[x2, min(y1, y2):max(y1, y2) + 1] = False
 
     else:
 
-        for y in range(min(y1, y2), max(y1, y2) + 1):
-            new_map[x1][y].block_path = False
-
-        for x in range(min(x1, x2), max(x1, x2) + 1):
-            new_map[x][y2].block_path = False
+        new_map.block_path[x1, min(y1, y2):max(y1, y2) + 1] = False
+        new_map.block_path[min(x1, x2):max(x1, x2) + 1, y2] = False
 
 def map_check_for_creature(x, y, exclude_object = None):
 
@@ -1329,62 +3906,106 @@ def map_check_for_creature(x, y, exclude_object = None):
 
     '''
 
-    # initialize target var to None type
-    target = None
+    # check the objects on that tile for a creature that isn't excluded
+    for obj in GAME.object_index.objects_at(x, y):
+        if obj.creature and obj is not exclude_object:
+            return obj
 
-    # optionally exclude an object
-    if exclude_object:
+def map_check_for_wall(x, y):
+    incoming_map[x][y].block_path
 
-        # check objectlist to find creature at that location that isn't excluded
-        for object in GAME.current_objects:
-            if (object is not exclude_object and
-                object.x == x and
-                object.y == y and
-                object.creature):
+def map_make_fov(incoming_map):
 
-                # if object is found, set target var to object
-                target = object
+    '''Creates an FOV map based on a map.
 
-            if target:
-                return target
+    Args:
+        incoming_map (struc_TileGrid): map, usually created with map_create
 
-    else:
-    # check objectlist to find any creature at that location
-        for object in GAME.current_objects:
-            if (object.x == x and
-                object.y == y and
-                object.creature):
+    Returns:
+        fov_map (libtcod map): a new FOV map matching incoming_map.
 
-                target = object
+    '''
 
-            if target:
-                return target
+    fov_map = libtcod.map_new(incoming_map.width, incoming_map.height)
 
-def map_check_for_wall(x, y):
-    incoming_map[x][y].block_path
+    # libtcod stores its cells row by row, the transpose is indexed [y, x]
+    tile_is_open = ~incoming_map.block_path.T
 
-def map_make_fov(incoming_map):
+    libtcod.map_set_properties_array(fov_map, tile_is_open, tile_is_open)
 
-    '''Creates an FOV map based on a map.
+    return fov_map
+
+def map_load_fov(incoming_map):
+
+    '''Makes the FOV map of incoming_map the FOV_MAP.
+
+    The FOV map is kept on the map itself, so this is a switch of FOV_MAP
+    unless the map has none yet, as happens after loading a game.
 
     Args:
-        incoming_map (array): map, usually created with map_create
+        incoming_map (struc_TileGrid): the map becoming the current map.
 
-    Effects:
-        generates the FOV_MAP
+    '''
+
+    global FOV_MAP, FOV_CALCULATE, FOV_MASK
+
+    if incoming_map.fov_map is None:
+        incoming_map.fov_map = map_make_fov(incoming_map)
+
+    FOV_MAP = incoming_map.fov_map
+    FOV_CALCULATE = True
+
+    # the mask of the last map no longer applies
+    FOV_MASK = None
+
+def map_tile_set_block(incoming_map, x, y, block_path):
+
+    '''Changes whether a tile blocks movement and sight.
+
+    The FOV map and the pre-rendered terrain of the map are updated for just
+    this tile, nothing is rebuilt.  The pathfinder reads the FOV map whenever
+    it finds a route, and the version of the map is incremented so the routes
+    and distance fields already found are found again.
+
+    Args:
+        incoming_map (struc_TileGrid): map the tile is on.
+        x (int): x map coord of the tile.
+        y (int): y map coord of the tile.
+        block_path (bool): True to turn the tile into a wall.
 
     '''
 
-    # need to create the Global Variable
-    global FOV_MAP
+    global FOV_CALCULATE
+
+    incoming_map.block_path[x, y] = block_path
+    incoming_map.version += 1
+
+    if incoming_map.fov_map is not None:
+        libtcod.map_set_properties(incoming_map.fov_map, x, y,
+                                   not block_path, not block_path)
+
+    if incoming_map.layer:
+        incoming_map.layer.tile_changed(incoming_map, x, y)
+
+    if GAME and incoming_map is GAME.current_map:
+        FOV_CALCULATE = True
+
+def map_delete(incoming_map):
+
+    '''Frees the libtcod FOV map and pathfinder of a map being thrown away.
+
+    Args:
+        incoming_map (struc_TileGrid): map that is no longer needed.
 
+    '''
 
-    FOV_MAP = libtcod.map_new(constants.MAP_WIDTH, constants.MAP_HEIGHT)
+    if incoming_map.pathfinder is not None:
+        libtcod.path_delete(incoming_map.pathfinder)
+        incoming_map.pathfinder = None
 
-    for y in range(constants.MAP_HEIGHT):
-        for x in range(constants.MAP_WIDTH):
-            libtcod.map_set_properties(FOV_MAP, x, y,
-                not incoming_map[x][y].block_path, not incoming_map[x][y].block_path)
+    if incoming_map.fov_map is not None:
+        libtcod.map_delete(incoming_map.fov_map)
+        incoming_map.fov_map = None
 
 def map_calculate_fov():
 
@@ -1395,7 +4016,7 @@ def map_calculate_fov():
 
     '''
 
-    global FOV_CALCULATE
+    global FOV_CALCULATE, FOV_MASK
 
     if FOV_CALCULATE:
 
@@ -1409,6 +4030,52 @@ def map_calculate_fov():
                                 constants.FOV_LIGHT_WALLS,
                                 constants.FOV_ALGO)
 
+        FOV_MASK = map_fov_mask()
+
+        # once a tile appears within the FOV, set it to explored
+        GAME.current_map.explored |= FOV_MASK
+
+        if GAME.current_map.layer:
+            GAME.current_map.layer.update(GAME.current_map, FOV_MASK)
+
+        # monsters asleep out of sight wake up once they can be seen
+        fov_x, fov_y = numpy.nonzero(FOV_MASK)
+        GAME.objects_wake(zip(fov_x.tolist(), fov_y.tolist()))
+
+def map_fov_mask():
+
+    '''Reads the result of the last FOV calculation into an array.
+
+    Returns:
+        fov_mask (numpy.ndarray): bool array indexed [x, y], True for every
+            tile within the FOV.
+
+    '''
+
+    return libtcod.map_get_fov_array(FOV_MAP).T
+
+def map_make_noise(coords, radius):
+
+    '''Alerts the monsters within radius of coords, waking the sleeping ones.
+
+    The noise is heard through walls.  An alerted monster keeps after the
+    player for NOISE_ALERT_TURNS turns even where the player can't see it.
+
+    Args:
+        coords (tuple): (x, y) map coords the noise is made at.
+        radius (int): how far the noise carries, in tiles.
+
+    '''
+
+    tiles = map_find_radius(coords, radius)
+
+    for x, y in tiles:
+        for obj in GAME.object_index.objects_at(x, y):
+            if obj.ai:
+                obj.ai.alert = constants.NOISE_ALERT_TURNS
+
+    GAME.objects_wake(tiles)
+
 def map_objects_at_coords(coords_x, coords_y):
 
     '''Get a list of every object at a coordinate.
@@ -1422,8 +4089,7 @@ def map_objects_at_coords(coords_x, coords_y):
 
     '''
 
-    object_options = [obj for obj in GAME.current_objects
-                      if obj.x == coords_x and obj.y == coords_y]
+    object_options = list(GAME.object_index.objects_at(coords_x, coords_y))
 
     return object_options
 
@@ -1437,22 +4103,66 @@ def map_find_line(coords1, coords2):
 
     x2, y2 = coords2
 
-    libtcod.line_init(x1, y1, x2, y2)
+    libtcod.line_init(x1, y1, x2, y2)
+
+    calc_x, calc_y = libtcod.line_step()
+
+    coord_list = []
+
+    if x1 == x2 and y1 == y2:
+        return [(x1, y1)]
+
+    while (not calc_x is None):
+
+        coord_list.append((calc_x, calc_y))
+
+        calc_x, calc_y = libtcod.line_step()
+
+    return coord_list
+
+def map_find_path(incoming_map, start_x, start_y, goal_x, goal_y):
+
+    '''Finds the shortest walkable path between two tiles with libtcod's A*.
+
+    Only walls block the path, creatures are not taken into account.
+
+    Args:
+        incoming_map (struc_TileGrid): map to find the path on.
+        start_x (int): x map coord the path starts from.
+        start_y (int): y map coord the path starts from.
+        goal_x (int): x map coord the path leads to.
+        goal_y (int): y map coord the path leads to.
+
+    Returns:
+        steps (list): (x, y) of every tile along the path, the first step
+            first and the goal last.  Empty if there is no path.
+
+    '''
+
+    if incoming_map.pathfinder is None:
+        if incoming_map.fov_map is None:
+            incoming_map.fov_map = map_make_fov(incoming_map)
+
+        incoming_map.pathfinder = libtcod.path_new_using_map(
+            incoming_map.fov_map)
 
-    calc_x, calc_y = libtcod.line_step()
+    path = incoming_map.pathfinder
 
-    coord_list = []
+    if not libtcod.path_compute(path, start_x, start_y, goal_x, goal_y):
+        return []
 
-    if x1 == x2 and y1 == y2:
-        return [(x1, y1)]
+    return [libtcod.path_get(path, i) for i in range(libtcod.path_size(path))]
 
-    while (not calc_x is None):
+def map_find_farthest_room(coords):
 
-        coord_list.append((calc_x, calc_y))
+    '''Returns the center of the room of the current level farthest from
+    coords.'''
 
-        calc_x, calc_y = libtcod.line_step()
+    coords_x, coords_y = coords
 
-    return coord_list
+    return max((room.center for room in GAME.current_rooms),
+               key = lambda center: ((center[0] - coords_x) ** 2 +
+                                     (center[1] - coords_y) ** 2))
 
 def map_find_radius(coords, radius):
 
@@ -1500,97 +4210,100 @@ def draw_game():
 
     # clear the display surface
     SURFACE_MAIN.fill(constants.COLOR_DEFAULT_BG)
-    SURFACE_MAP.fill(constants.COLOR_BLACK)
 
     CAMERA.update()
 
-    # draw the map
+    # draw the map, this covers everything within the camera
     draw_map(GAME.current_map)
+    FRAME_TIMER.lap("map")
 
     # draw all objects
-    for obj in sorted(GAME.current_objects, key = lambda obj: obj.depth,
-        reverse = True):
-        obj.draw()
+    draw_objects(GAME.object_index.draw_order)
 
     SURFACE_MAIN.blit(SURFACE_MAP, (0, 0), CAMERA.rectangle)
+    FRAME_TIMER.lap("objects")
 
     draw_debug()
+    FRAME_TIMER.lap("debug")
+
     draw_messages()
+    FRAME_TIMER.lap("messages")
 
 def draw_map(map_to_draw):
 
     '''Main call for drawing a map to the screen.
 
-    draw_map loops through every tile within the map and draws it's
-    corresponding tile to the screen.
+    draw_map copies the part of the map's pre-rendered terrain that is within
+    the camera to the screen.  The terrain is rendered the first time a map is
+    drawn, after that map_calculate_fov keeps it up to date.
 
     Args:
-        map_to_draw (array): the map to draw in the background.  Under most
-            circumstances, should be the GAME.current_map object.
+        map_to_draw (struc_TileGrid): the map to draw in the background.  Under
+            most circumstances, should be the GAME.current_map object.
 
     '''
 
-    cam_x, cam_y = CAMERA.map_address
+    if map_to_draw.layer is None:
+        map_to_draw.layer = obj_MapLayer(map_to_draw)
 
-    display_map_w = constants.CAMERA_WIDTH / constants.CELL_WIDTH
-    display_map_h = constants.CAMERA_HEIGHT / constants.CELL_HEIGHT
+        if FOV_MASK is not None:
+            map_to_draw.layer.update(map_to_draw, FOV_MASK)
 
-    render_w_min = cam_x - (display_map_w / 2)
-    render_h_min = cam_y - (display_map_h / 2)
-    render_w_max = cam_x + (display_map_w / 2)
-    render_h_max = cam_y + (display_map_h / 2)
+    layer_surface = map_to_draw.layer.surface
 
-    if render_w_min < 0: render_w_min = 0
-    if render_h_min < 0: render_h_min = 0
+    # only the part of the camera that overlaps the map
+    render_rect = CAMERA.rectangle.clip(layer_surface.get_rect())
 
-    if render_w_max > constants.MAP_WIDTH: render_w_max = constants.MAP_WIDTH
-    if render_h_max > constants.MAP_HEIGHT: render_h_max = constants.MAP_HEIGHT
+    SURFACE_MAP.blit(layer_surface, render_rect, render_rect)
 
-    # Loop through every object in the map
-    for x in range(render_w_min, render_w_max):
-        for y in range(render_h_min, render_h_max):
+def draw_objects(objects):
 
-            # Does this tile appear within the current FOV?
-            is_visible = libtcod.map_is_in_fov(FOV_MAP, x, y)
+    '''Draws the visible objects onto SURFACE_MAP.
+
+    Objects outside the camera are skipped before their FOV is checked, so
+    the cost of a frame depends on what is on screen rather than on how many
+    objects the level holds.  The sprites of the objects that are left are
+    handed to pygame in a single Surface.blits call.
+
+    Args:
+        objects (list): the objects to draw, sorted deepest first.  Usually
+            GAME.object_index.draw_order.
+
+    '''
 
-            if is_visible:
+    camera_rect = CAMERA.rectangle
 
-                # once the tile appears within the FOV, set to explored
-                map_to_draw[x][y].explored = True
+    # the tiles at least partly within the camera
+    min_x = camera_rect.left // constants.CELL_WIDTH
+    min_y = camera_rect.top // constants.CELL_HEIGHT
+    max_x = (camera_rect.right - 1) // constants.CELL_WIDTH
+    max_y = (camera_rect.bottom - 1) // constants.CELL_HEIGHT
 
-                # if tile is blocked, draw a wall.
-                if map_to_draw[x][y].block_path == True:
+    sprites = []
 
-                    # draw wall
-                    SURFACE_MAP.blit(ASSETS.S_WALL,
-                                      (x * constants.CELL_WIDTH,
-                                       y * constants.CELL_HEIGHT))
-                else: # otherwise, draw a floor
-                    SURFACE_MAP.blit(ASSETS.S_FLOOR,
-                                      (x * constants.CELL_WIDTH,
-                                       y * constants.CELL_HEIGHT))
+    for obj in objects:
+        x, y = obj.x, obj.y
 
-            # if tile is not visible, is it explored?
-            elif map_to_draw[x][y].explored:
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            continue
 
-                # if yes, and the tile is blocked, draw an explored wall.
-                if map_to_draw[x][y].block_path == True:
+        if FOV_MASK is not None:
+            is_visible = FOV_MASK[x, y]
+        else:
+            is_visible = libtcod.map_is_in_fov(FOV_MAP, x, y)
 
-                    # draw wall
-                    SURFACE_MAP.blit(ASSETS.S_WALLEXPLORED,
-                                      (x * constants.CELL_WIDTH,
-                                       y * constants.CELL_HEIGHT))
-                else: #otherwise, draw a floor
-                    SURFACE_MAP.blit(ASSETS.S_FLOOREXPLORED,
-                                      (x * constants.CELL_WIDTH,
-                                       y * constants.CELL_HEIGHT))
+        if is_visible:
+            sprites.append(obj.sprite())
+
+    SURFACE_MAP.blits(sprites, False)
 
 def draw_debug():
 
     '''Draw the debug console to the display surface.
 
     This method draws a debug console to the upper left corner of the window.
-    For now, this debug console is limited to the current FPS.
+    It shows the current FPS and, once expanded with the overlay key, the
+    percentiles of each phase of the frame kept by FRAME_TIMER.
 
     '''
 
@@ -1601,6 +4314,20 @@ def draw_debug():
               constants.COLOR_WHITE,
               constants.COLOR_BLACK)
 
+    if not FRAME_TIMER.overlay:
+        return
+
+    text_height = helper_text_height(constants.FONT_MESSAGE_TEXT)
+    start_y = helper_text_height(constants.FONT_DEBUG_MESSAGE)
+
+    for i, line in enumerate(FRAME_TIMER.overlay_lines()):
+        draw_text(SURFACE_MAIN,
+                  line,
+                  constants.FONT_MESSAGE_TEXT,
+                  (0, start_y + (i * text_height)),
+                  constants.COLOR_WHITE,
+                  constants.COLOR_BLACK)
+
 def draw_messages():
 
     '''Draw the messages console to the display surface.
@@ -1717,17 +4444,11 @@ def helper_text_objects(incoming_text, incoming_font, incoming_color, incoming_b
 
     '''
 
-    # if there is a background color, render with that.
-    if incoming_bg:
-        Text_surface = incoming_font.render(incoming_text,
-                                            False,
-                                            incoming_color,
-                                            incoming_bg)
-
-    else:  # otherwise, render without a background.
-        Text_surface = incoming_font.render(incoming_text,
-                                            False,
-                                            incoming_color)
+    # reuse the surface if this text has been rendered recently
+    Text_surface = TEXT_CACHE.render(incoming_text,
+                                     incoming_font,
+                                     incoming_color,
+                                     incoming_bg)
 
     return Text_surface, Text_surface.get_rect()
 
@@ -1743,14 +4464,13 @@ def helper_text_height(font):
         font (pygame.font.Font): the font whose height is desired.
 
     Returns:
-        font_rect.height (int): the height, in pixels, of the font.
+        font_height (int): the height, in pixels, of the font.
 
     '''
 
-    # render the font out
-    font_rect = font.render('a', False, (0, 0, 0)).get_rect()
+    font_width, font_height = TEXT_CACHE.font_size(font)
 
-    return font_rect.height
+    return font_height
 
 def helper_text_width(font):
 
@@ -1764,14 +4484,13 @@ def helper_text_width(font):
         font (pygame.font.Font): the font whose width is desired.
 
     Returns:
-        font_rect.width (int): the width, in pixels, of the font.
+        font_width (int): the width, in pixels, of the font.
 
     '''
 
-    # render the font out
-    font_rect = font.render('a', False, (0, 0, 0)).get_rect()
+    font_width, font_height = TEXT_CACHE.font_size(font)
 
-    return font_rect.width
+    return font_width
 
 
 #  __  __             _
@@ -1874,6 +4593,9 @@ def cast_confusion(caster, effect_length):
             target.ai = ai_Confuse(old_ai = oldai, num_turns = effect_length)
             target.ai.owner = target
 
+            # a confused creature wanders whether it is seen or not
+            GAME.scheduler.wake(target)
+
             game_message("The creature's eyes glaze over", constants.COLOR_GREEN)
 
 
@@ -2008,12 +4730,22 @@ class ui_Slider:
 # | |  | |  __/ | | | |_| \__ \
 # |_|  |_|\___|_| |_|\__,_|___/
 
-def menu_main():
+def menu_main(seed = None):
+
+    '''The title screen.
+
+    Args:
+        seed (int, optional): seed of every new game started, see obj_Game.
+
+    '''
 
     button_y_offset = 40
 
     game_initialize()
 
+    # load the rest of the assets while the menu shows
+    ASSETS.preload()
+
     menu_running = True
 
     title_x = constants.CAMERA_WIDTH/2
@@ -2046,8 +4778,7 @@ def menu_main():
                             (150, 30),
                             (title_x, quit_button_y))
 
-    pygame.mixer.music.load(ASSETS.music_background)
-    pygame.mixer.music.play(-1)
+    ASSETS.music_play(ASSETS.music_background)
 
     while menu_running:
 
@@ -2064,20 +4795,20 @@ def menu_main():
 
         #button updates
         if continue_game_button.update(game_input):
-            pygame.mixer.music.stop()
+            ASSETS.music_stop()
             # try to load game, start new if problems
             try:
                 game_load()
             except:
-                game_new()
+                game_new(seed)
 
             game_main_loop()
             game_initialize()
 
 
         if new_game_button.update(game_input):
-            pygame.mixer.music.stop()
-            game_new()
+            ASSETS.music_stop()
+            game_new(seed)
             game_main_loop()
             game_initialize()
 
@@ -2247,7 +4978,7 @@ def menu_pause():
     while not menu_close: # while False, pause continues
 
         # get list of inputs
-        events_list = pygame.event.get()
+        events_list = INPUT.get_events()
 
         # evaluate for each event
         for event in events_list:
@@ -2264,7 +4995,7 @@ def menu_pause():
             ((window_width / 2) - (text_width / 2), (window_height / 2) - (text_height / 2)),
             constants.COLOR_WHITE, constants.COLOR_BLACK)
 
-        CLOCK.tick(constants.GAME_FPS)
+        game_clock_tick()
 
         # update the display surface
         pygame.display.flip()
@@ -2310,8 +5041,8 @@ def menu_inventory():
         print_list = [obj.display_name for obj in PLAYER.container.inventory]
 
         ## Get list of input events
-        events_list = pygame.event.get()
-        mouse_x, mouse_y = pygame.mouse.get_pos()
+        mouse_x, mouse_y = INPUT.get_mouse_pos()
+        events_list = INPUT.get_events()
 
         mouse_x_rel = mouse_x - menu_x
         mouse_y_rel = mouse_y - menu_y
@@ -2366,7 +5097,7 @@ def menu_inventory():
         SURFACE_MAIN.blit(local_inventory_surface, (menu_x, menu_y))
 
 
-        CLOCK.tick(constants.GAME_FPS)
+        game_clock_tick()
 
         # update the display surface
         pygame.display.update()
@@ -2384,10 +5115,10 @@ def menu_tile_select(coords_origin = None, max_range = None, radius = None,
     while not menu_close:
 
         # Get mos position
-        mouse_x, mouse_y = pygame.mouse.get_pos()
+        mouse_x, mouse_y = INPUT.get_mouse_pos()
 
         # Get button clicks
-        events_list = pygame.event.get()
+        events_list = INPUT.get_events()
 
         # mouse map selection
 
@@ -2410,7 +5141,7 @@ def menu_tile_select(coords_origin = None, max_range = None, radius = None,
                     break
 
                 # stop at wall
-                if not penetrate_walls and GAME.current_map[x][y].block_path:
+                if not penetrate_walls and GAME.current_map.block_path[x, y]:
                     break
 
                 # stop at creature
@@ -2437,7 +5168,6 @@ def menu_tile_select(coords_origin = None, max_range = None, radius = None,
 
         # draw game first
         SURFACE_MAIN.fill(constants.COLOR_DEFAULT_BG)
-        SURFACE_MAP.fill(constants.COLOR_BLACK)
 
         CAMERA.update()
 
@@ -2445,9 +5175,7 @@ def menu_tile_select(coords_origin = None, max_range = None, radius = None,
         draw_map(GAME.current_map)
 
         # draw all objects
-        for obj in sorted(GAME.current_objects, key = lambda obj: obj.depth,
-            reverse = True):
-            obj.draw()
+        draw_objects(GAME.object_index.draw_order)
 
         # Draw rectangle at mouse position on top of game
         for (tile_x, tile_y) in valid_tiles:
@@ -2475,7 +5203,7 @@ def menu_tile_select(coords_origin = None, max_range = None, radius = None,
         pygame.display.flip()
 
         # tick the CLOCK
-        CLOCK.tick(constants.GAME_FPS)
+        game_clock_tick()
 
 
 #   ____                           _
@@ -2507,7 +5235,7 @@ def gen_player(coords):
                        creature = creature_com,
                        container = container_com)
 
-    GAME.current_objects.append(PLAYER)
+    GAME.add_object(PLAYER)
 
 ## SPECIAL
 def gen_stairs(coords, downwards = True):
@@ -2527,7 +5255,7 @@ def gen_stairs(coords, downwards = True):
                            depth = constants.DEPTH_BKGD,
                            stairs = stairs_com)
 
-    GAME.current_objects.append(stairs)
+    return stairs
 
 def gen_portal(coords):
 
@@ -2538,7 +5266,7 @@ def gen_portal(coords):
                        depth = constants.DEPTH_BKGD,
                        exitportal = port_com)
 
-    GAME.current_objects.append(portal)
+    return portal
 
 def gen_LAMP(coords):
 
@@ -2552,36 +5280,40 @@ def gen_LAMP(coords):
                               item = item_com)
 
 
-    GAME.current_objects.append(return_object)
+    return return_object
 
 ## ITEMS
-def gen_item(coords):
+def gen_item(coords, streams = None):
+
+    streams = streams or GAME.random
 
-    random_num = libtcod.random_get_int(0, 1, 5)
+    random_num = streams.loot.randint(1, 5)
 
     if random_num == 1:
-        new_item = gen_scroll_lightning(coords)
+        new_item = gen_scroll_lightning(coords, streams)
 
     elif random_num == 2:
-        new_item = gen_scroll_fireball(coords)
+        new_item = gen_scroll_fireball(coords, streams)
 
     elif random_num == 3:
-        new_item = gen_scroll_confusion(coords)
+        new_item = gen_scroll_confusion(coords, streams)
 
     elif random_num == 4:
-        new_item = gen_weapon_sword(coords)
+        new_item = gen_weapon_sword(coords, streams)
 
     elif random_num == 5:
-        new_item = gen_armor_shield(coords)
+        new_item = gen_armor_shield(coords, streams)
 
-    GAME.current_objects.append(new_item)
+    return new_item
 
-def gen_scroll_lightning(coords):
+def gen_scroll_lightning(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    damage = libtcod.random_get_int(0, 5, 7)
-    m_range = libtcod.random_get_int(0, 7, 8)
+    damage = streams.loot.randint(5, 7)
+    m_range = streams.loot.randint(7, 8)
 
     item_com = com_Item(use_function = cast_lightning,
                         value = (damage, m_range))
@@ -2594,13 +5326,15 @@ def gen_scroll_lightning(coords):
 
     return return_object
 
-def gen_scroll_fireball(coords):
+def gen_scroll_fireball(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    damage = libtcod.random_get_int(0, 2, 4)
+    damage = streams.loot.randint(2, 4)
     radius = 1
-    m_range = libtcod.random_get_int(0, 9, 12)
+    m_range = streams.loot.randint(9, 12)
 
     item_com = com_Item(use_function = cast_fireball,
                         value = (damage, radius, m_range))
@@ -2613,11 +5347,13 @@ def gen_scroll_fireball(coords):
 
     return return_object
 
-def gen_scroll_confusion(coords):
+def gen_scroll_confusion(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    effect_length = libtcod.random_get_int(0, 5, 10)
+    effect_length = streams.loot.randint(5, 10)
 
     item_com = com_Item(use_function = cast_confusion,
                         value = effect_length)
@@ -2629,11 +5365,13 @@ def gen_scroll_confusion(coords):
 
     return return_object
 
-def gen_weapon_sword(coords):
+def gen_weapon_sword(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    bonus = libtcod.random_get_int(0, 1, 5)
+    bonus = streams.loot.randint(1, 5)
 
     equipment_com = com_Equipment(attack_bonus = bonus, slot = "right_hand")
 
@@ -2643,11 +5381,13 @@ def gen_weapon_sword(coords):
 
     return return_object
 
-def gen_armor_shield(coords):
+def gen_armor_shield(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    bonus = libtcod.random_get_int(0, 1, 5)
+    bonus = streams.loot.randint(1, 5)
 
     equipment_com = com_Equipment(defense_bonus = bonus, slot = "left_hand")
 
@@ -2658,30 +5398,34 @@ def gen_armor_shield(coords):
     return return_object
 
 ## ENEMIES
-def gen_enemy(coords):
+def gen_enemy(coords, streams = None):
+
+    streams = streams or GAME.random
 
-    random_num = libtcod.random_get_int(0, 1, 100)
+    random_num = streams.mapgen.randint(1, 100)
 
     if random_num <= 15:
-        new_enemy = gen_snake_cobra(coords)
+        new_enemy = gen_snake_cobra(coords, streams)
 
     elif random_num <= 50:
-        new_enemy = gen_mouse(coords)
+        new_enemy = gen_mouse(coords, streams)
 
     else:
-        new_enemy = gen_snake_anaconda(coords)
+        new_enemy = gen_snake_anaconda(coords, streams)
 
-    GAME.current_objects.append(new_enemy)
+    return new_enemy
 
-def gen_snake_anaconda(coords):
+def gen_snake_anaconda(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    base_attack = libtcod.random_get_int(0, 1, 2)
+    base_attack = streams.mapgen.randint(1, 2)
 
-    max_health = libtcod.random_get_int(0, 5, 10)
+    max_health = streams.mapgen.randint(5, 10)
 
-    creature_name = libtcod.namegen_generate("Celtic female")
+    creature_name = gen_name("Celtic female", streams.names)
 
     creature_com = com_Creature(creature_name,
                                 base_atk = base_attack,
@@ -2698,15 +5442,17 @@ def gen_snake_anaconda(coords):
 
     return snake
 
-def gen_snake_cobra(coords):
+def gen_snake_cobra(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
-    base_attack = libtcod.random_get_int(0, 3, 6)
+    base_attack = streams.mapgen.randint(3, 6)
 
-    max_health = libtcod.random_get_int(0, 15, 20)
+    max_health = streams.mapgen.randint(15, 20)
 
-    creature_name = libtcod.namegen_generate("Celtic male")
+    creature_name = gen_name("Celtic male", streams.names)
 
     # create lobster 1
     creature_com = com_Creature(creature_name,
@@ -2724,7 +5470,9 @@ def gen_snake_cobra(coords):
 
     return snake
 
-def gen_mouse(coords):
+def gen_mouse(coords, streams = None):
+
+    streams = streams or GAME.random
 
     x, y = coords
 
@@ -2732,7 +5480,7 @@ def gen_mouse(coords):
 
     max_health = 1
 
-    creature_name = libtcod.namegen_generate("Celtic male")
+    creature_name = gen_name("Celtic male", streams.names)
 
     # create mouse
     creature_com = com_Creature(creature_name,
@@ -2742,7 +5490,8 @@ def gen_mouse(coords):
 
     ai_com = ai_Flee()
 
-    item_com = com_Item(use_function = cast_heal, value = libtcod.random_get_int(0, 2, 10))#value of heal
+    item_com = com_Item(use_function = cast_heal,
+                        value = streams.loot.randint(2, 10))#value of heal
 
     mouse = obj_Actor(x, y, "mouse",
                       animation_key = "A_MOUSE",
@@ -2754,6 +5503,57 @@ def gen_mouse(coords):
 
     return mouse
 
+## NAMES
+def gen_name(name_set, rng):
+
+    '''Returns a random name from one of libtcod's name sets.
+
+    libtcod's name generator rolls with libtcod's default generator, which is
+    seeded from rng before every name so names can be replayed.  The name
+    generator is not thread safe and levels are generated on a background
+    thread, so every name is generated under NAMEGEN_LOCK.
+
+    Args:
+        name_set (str): name of the set, "Celtic male" for example.
+        rng (random.Random): generator the name is rolled with.
+
+    '''
+
+    with NAMEGEN_LOCK:
+        seeded = libtcod.random_new_from_seed(rng.randint(0, 0x7FFFFFFF))
+        libtcod.random_restore(0, seeded)
+        libtcod.random_delete(seeded)
+
+        return libtcod.namegen_generate(name_set)
+
+## LEVELS
+def gen_level(current_level, seed):
+
+    '''Creates a whole new level, its map and the actors on it.
+
+    Everything is rolled from seed and nothing global is changed, the actors
+    only look up their sprites once they are drawn.  The one thing shared is
+    libtcod's name generator, used under NAMEGEN_LOCK, see gen_name.  So this
+    is safe to call on a background thread, see obj_LevelPregen.
+
+    Args:
+        current_level (int): depth of the level, the top level is 1.
+        seed (int): seed of the level, the same seed gives the same level.
+
+    Returns:
+        level (tuple): (map, rooms, actors not including the player,
+            player start coords)
+
+    '''
+
+    streams = obj_RandomStreams(seed)
+
+    new_map, room_list = map_create(streams.mapgen)
+    level_objects, player_coords = map_place_objects(room_list,
+                                                     current_level, streams)
+
+    return (new_map, room_list, level_objects, player_coords)
+
 
 #   ____
 #  / ___| __ _ _ __ ___   ___
@@ -2772,50 +5572,110 @@ def game_main_loop():
     # player action definition
     player_action = "no-action"
 
+    if PROFILE_ON_START:
+        PROFILER.start(*PROFILE_ON_START)
+
     while not game_quit:
 
+        FRAME_TIMER.frame_start()
+
         # handle player input
         player_action = game_handle_keys()
+        FRAME_TIMER.lap("input")
 
         map_calculate_fov()
+        FRAME_TIMER.lap("fov")
 
         if player_action == "QUIT":
+            # scripted and replayed games have nothing to save, hand back to
+            # the caller
+            if not INPUT.realtime:
+                break
+
             game_exit()
 
-        for obj in GAME.current_objects:
-            if obj.ai:
-                if player_action != "no-action":
-                    obj.ai.take_turn()
-            if obj.exitportal:
-                obj.exitportal.update()
+        # the rest of the level gets as much time as the player's turn took
+        if player_action != "no-action":
+            GAME.take_turns(PLAYER.creature.action_delay)
+        FRAME_TIMER.lap("ai")
+
+        for portal in GAME.current_portals:
+            portal.exitportal.update()
+        FRAME_TIMER.lap("portals")
 
         if (PLAYER.state == "STATUS_DEAD" or
             PLAYER.state == "STATUS_WIN"):
             game_quit = True
 
 
-        # draw the game
-        draw_game()
+        if not HEADLESS:
+            # draw the game
+            draw_game()
 
-        # update the display
-        pygame.display.flip()
+            # update the display
+            pygame.display.flip()
+            FRAME_TIMER.lap("flip")
 
-        # tick the CLOCK
-        CLOCK.tick(constants.GAME_FPS)
+        FRAME_TIMER.frame_end()
+        PROFILER.frame_end(player_action != "no-action")
+
+        game_clock_tick()
 
-def game_initialize():
+    # a profile cut short by the end of the game still gets written
+    PROFILER.stop()
+
+    # a level generated ahead for this game is of no use to the next one
+    LEVEL_PREGEN.discard()
+
+def game_clock_tick():
+
+    '''Ticks the CLOCK once a frame.
+
+    While a person plays, the frame rate is held at constants.GAME_FPS.
+    Scripted and replayed input runs as fast as it can.  ANIMATION_CLOCK is
+    advanced by however long the frame took.
+
+    '''
+
+    if INPUT.realtime:
+        frame_time = CLOCK.tick(constants.GAME_FPS)
+    else:
+        frame_time = CLOCK.tick()
+
+    ANIMATION_CLOCK.tick(frame_time)
+
+def game_initialize(headless = False):
 
     '''This function initializes the main window, and pygame.
 
+    Args:
+        headless (bool, optional): if True, pygame uses the SDL dummy video
+            and audio drivers and the game is never drawn.
+
     '''
 
     global SURFACE_MAIN, SURFACE_MAP
-    global CLOCK, FOV_CALCULATE, ASSETS, CAMERA, RANDOM_ENGINE
-    global PREFERENCES
+    global CLOCK, ANIMATION_CLOCK, FOV_CALCULATE, FOV_MASK, ASSETS, CAMERA
+    global PREFERENCES, TEXT_CACHE, HEADLESS, INPUT, FRAME_TIMER, PROFILER
+    global LEVEL_PREGEN, NAMEGEN_LOCK, CHASE_FIELD, BATCH_AI
+
+    HEADLESS = headless
+
+    if HEADLESS:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+        # importing constants already started pygame with the real drivers
+        pygame.display.quit()
+        pygame.mixer.quit()
 
     # initialize pygame
     pygame.init()
 
+    if HEADLESS or not AUDIO_ENABLED:
+        # nothing is ever played, so the audio device is let go
+        pygame.mixer.quit()
+
     pygame.key.set_repeat(200, 70)
 
     # Initialize Preferences
@@ -2824,7 +5684,10 @@ def game_initialize():
     except:
         PREFERENCES = struc_Preferences()
 
-    libtcod.namegen_parse('data\\namegen\\jice_celtic.cfg')
+    libtcod.namegen_parse('data/namegen/jice_celtic.cfg')
+
+    # NAMEGEN_LOCK guards libtcod's name generator, see gen_name
+    NAMEGEN_LOCK = threading.Lock()
 
     # SURFACE_MAIN is the display surface, a special surface that serves as the
     # root console of the whole game.  Anything that appears in the game must be
@@ -2837,18 +5700,47 @@ def game_initialize():
 
     CAMERA = obj_Camera()
 
-    # ASSETS stores the games assets
-    ASSETS = obj_Assets()
+    # TEXT_CACHE keeps recently rendered text
+    TEXT_CACHE = obj_TextCache(constants.TEXT_CACHE_SIZE)
+
+    # FRAME_TIMER times the phases of every frame
+    FRAME_TIMER = obj_FrameTimer(constants.FRAME_TIMER_SAMPLES)
+
+    # PROFILER captures profiles on demand
+    PROFILER = obj_Profiler()
+
+    # ASSETS stores the games assets, loading them as they are first used
+    audio = AUDIO_ENABLED and not HEADLESS
+
+    if ASSETS is None or ASSETS.audio != audio:
+        ASSETS = obj_Assets(audio = audio)
+    else:
+        ASSETS.volume_adjust()
 
     # The CLOCK tracks and limits cpu cycles
     CLOCK = pygame.time.Clock()
 
-    # RANDOM NUMBER ENGINE
-    RANDOM_ENGINE = random.SystemRandom()
+    # ANIMATION_CLOCK picks the frame every animation is showing
+    ANIMATION_CLOCK = obj_AnimationClock()
+
+    # INPUT is where game_handle_keys reads player input from
+    INPUT = obj_InputLive()
+
+    # LEVEL_PREGEN generates the next level while the current one is played
+    LEVEL_PREGEN = obj_LevelPregen()
 
     # when FOV_CALCULATE is true, FOV recalculates
     FOV_CALCULATE = True
 
+    # FOV_MASK holds the result of the last FOV calculation
+    FOV_MASK = None
+
+    # CHASE_FIELD leads chasing monsters to the player
+    CHASE_FIELD = obj_DistanceField(constants.CHASE_FIELD_RADIUS)
+
+    # BATCH_AI takes the turns of crowds of monsters
+    BATCH_AI = obj_BatchAI()
+
 def game_handle_keys():
 
     '''Handles player input
@@ -2857,8 +5749,8 @@ def game_handle_keys():
 
     global FOV_CALCULATE
     # get player input
-    keys_list = pygame.key.get_pressed()
-    events_list = pygame.event.get()
+    keys_list = INPUT.get_pressed()
+    events_list = INPUT.get_events()
 
     #Check for mod key
     MOD_KEY = (keys_list[pygame.K_RSHIFT] or
@@ -2923,6 +5815,32 @@ def game_handle_keys():
             if event.key == pygame.K_i:
                 menu_inventory()
 
+            # frame timing overlay key -> show or hide the phase timings
+            if event.key == constants.KEY_FRAME_OVERLAY:
+                FRAME_TIMER.overlay = not FRAME_TIMER.overlay
+
+            # frame timing dump key -> write the phase timings to a file
+            if event.key == constants.KEY_FRAME_DUMP:
+                filename = ("data/frametimes_" +
+                            datetime.datetime.now().strftime("%Y%m%d_%H%M%S") +
+                            ".json")
+
+                FRAME_TIMER.dump(filename)
+
+                game_message("Frame times written to " + filename,
+                             constants.COLOR_WHITE)
+
+            # profile keys -> profile the next frames
+            if event.key in (constants.KEY_PROFILE,
+                             constants.KEY_PROFILE_SAMPLE):
+                mode = ("cprofile" if event.key == constants.KEY_PROFILE
+                        else "sample")
+
+                if PROFILER.start(mode, constants.PROFILE_FRAMES):
+                    game_message("Profiling " +
+                                 str(constants.PROFILE_FRAMES) + " frames",
+                                 constants.COLOR_WHITE)
+
             # key 'l' -> turn on tile selection
             if MOD_KEY and event.key == pygame.K_PERIOD:
                 list_of_objs = map_objects_at_coords(PLAYER.x, PLAYER.y)
@@ -2948,54 +5866,402 @@ def game_message(game_msg, msg_color = constants.COLOR_GREY):
 
     GAME.message_history.append((game_msg, msg_color))
 
-def game_new():
+def game_new(seed = None):
+
+    '''Starts a new game.
+
+    Args:
+        seed (int, optional): seed of the game, see obj_Game.
+
+    '''
 
     global GAME
 
+    if GAME:
+        GAME.levels_delete()
+
     # GAME tracks game progress
-    GAME = obj_Game()
+    GAME = obj_Game(seed)
 
     gen_player((0, 0))
 
-    map_place_objects(GAME.current_rooms)
+    GAME.level_new()
 
 def game_exit():
 
+    PROFILER.stop()
+
     game_save()
 
+    # a recording must be finished before the game quits
+    INPUT.close()
+
     # quit the game
     pygame.quit()
     sys.exit()
 
-def game_save():
+def game_save(file_name = 'data/savegame'):
+
+    '''Saves the game, one compressed record per level.
+
+    The file starts with a header: constants.SAVE_MAGIC, constants.SAVE_VERSION,
+    the number of records and the (offset, length) of every record.  The
+    records follow, each a zlib compressed pickle:
+
+    0) GAME without its message history or other levels, and PLAYER
+    1) GAME.message_history
+    2) one record per level in GAME.maps_previous, then GAME.maps_next
+
+    Levels that are still in the file from the last load are copied over as
+    they are, without unpickling them.
+
+    Args:
+        file_name (str, optional): file the game is saved to.
+
+    '''
 
     for obj in GAME.current_objects:
         obj.animation_destroy()
 
-    with gzip.open('data\savegame', 'wb') as file:
-        pickle.dump([GAME, PLAYER], file)
+    game_record = copy.copy(GAME)
+    game_record.message_history = None
+    game_record.maps_previous = len(GAME.maps_previous)
+    game_record.maps_next = len(GAME.maps_next)
+
+    levels = GAME.maps_previous + GAME.maps_next
+
+    records = [game_save_pack([game_record, PLAYER], player_ref = False),
+               game_save_pack(GAME.message_history)]
+
+    for level in levels:
+        if isinstance(level, struc_SaveRecord):
+            records.append(level.read())
+        else:
+            records.append(game_save_pack(level))
+
+    header_format = "<" + str(len(constants.SAVE_MAGIC)) + "sHI"
+    offset = (struct.calcsize(header_format) +
+              len(records) * struct.calcsize("<QI"))
+
+    offsets = []
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+
+    # written next to the old file, which the levels above may still be in
+    with open(file_name + ".tmp", 'wb') as file:
+        file.write(struct.pack(header_format, constants.SAVE_MAGIC,
+                               constants.SAVE_VERSION, len(records)))
+
+        for offset, record in zip(offsets, records):
+            file.write(struct.pack("<QI", offset, len(record)))
+
+        for record in records:
+            file.write(record)
+
+    if os.path.isfile(file_name):
+        os.remove(file_name)
+    os.rename(file_name + ".tmp", file_name)
+
+    # levels left in the old file now live at a new offset
+    for level, offset in zip(levels, offsets[2:]):
+        if isinstance(level, struc_SaveRecord):
+            level.file_name = file_name
+            level.offset = offset
+
+def game_load(file_name = 'data/savegame'):
+
+    '''Loads a game saved by game_save.
+
+    Only the current level is read, the other levels are read when the player
+    goes back to them.  Saves from before the record format are read whole.
 
-def game_load():
+    Args:
+        file_name (str, optional): file the game is loaded from.
+
+    '''
 
     global GAME, PLAYER
 
-    with gzip.open('data\savegame', 'rb') as file:
-        GAME, PLAYER = pickle.load(file)
+    # freed once the game in the file has replaced it
+    previous_game = GAME
+
+    header_format = "<" + str(len(constants.SAVE_MAGIC)) + "sHI"
+
+    with open(file_name, 'rb') as file:
+        header = file.read(struct.calcsize(header_format))
+
+        if not header.startswith(constants.SAVE_MAGIC):
+            records = None
+
+        else:
+            magic, version, num_records = struct.unpack(header_format, header)
+
+            if version > constants.SAVE_VERSION:
+                raise ValueError("save file version " + str(version) +
+                                 " is newer than this game")
+
+            records = []
+            for i in range(num_records):
+                offset, length = struct.unpack("<QI",
+                    file.read(struct.calcsize("<QI")))
+                records.append(struc_SaveRecord(file_name, offset, length))
+
+    if records is None:
+        with gzip.open(file_name, 'rb') as file:
+            GAME, PLAYER = obj_LegacyUnpickler(file).load()
+
+    else:
+        GAME, PLAYER = records[0].load()
+
+        GAME.message_history = records[1].load()
+
+        num_previous = GAME.maps_previous
+        GAME.maps_previous = records[2:2 + num_previous]
+        GAME.maps_next = records[2 + num_previous:]
+
+    # games saved before the random streams replay from the game's seed
+    if GAME.random is None:
+        GAME.random = obj_RandomStreams(GAME.seed)
+
+    GAME.objects_reindex()
 
     for obj in GAME.current_objects:
         obj.animation_init()
 
-    # create FOV_MAP
-    map_make_fov(GAME.current_map)
+    # the FOV map is not saved, rebuild it
+    map_load_fov(GAME.current_map)
+
+    if previous_game:
+        previous_game.levels_delete()
+
+    GAME.level_pregen()
+
+def game_headless(script_file = None, num_games = 1, max_turns = 1000,
+                  seed = None):
+
+    '''Plays games without a window, driven by scripted input.
+
+    Each game ends when the player dies or wins, or when the script runs out,
+    and a line summing the game up is printed.
+
+    Args:
+        script_file (str, optional): file with one action per line, see
+            obj_InputScript.ACTION_KEYS.  If not included every game is
+            played by game_script_random.
+        num_games (int, optional): number of games to play.
+        max_turns (int, optional): most actions played in a single game.
+        seed (int, optional): the seeds of the games are derived from it, so
+            the same seed plays the same games.  Picked at random if not
+            included.
+
+    '''
+
+    global INPUT
+
+    game_initialize(headless = True)
+
+    if script_file:
+        script_actions = game_script_load(script_file)
+
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 0x7FFFFFFF)
+
+    seeds = obj_RandomStreams(seed)
+
+    for game_num in range(num_games):
+
+        game_new(seeds.derive("game", game_num))
+
+        if script_file:
+            actions = script_actions[:max_turns]
+        else:
+            actions = game_script_random(max_turns,
+                random.Random(GAME.random.derive("script")))
+
+        INPUT = obj_InputScript(actions)
+
+        time_start = time.time()
+        game_main_loop()
+        time_elapsed = time.time() - time_start
+
+        turns_per_sec = INPUT.actions_played / max(time_elapsed, 1e-6)
+
+        print("game " + str(game_num + 1) + "/" + str(num_games) +
+              ": " + (PLAYER.state or "STATUS_ALIVE") +
+              ", turns " + str(INPUT.actions_played) +
+              ", depth " + str(len(GAME.maps_previous) + 1) +
+              ", hp " + str(PLAYER.creature.current_hp) +
+              ", seed " + str(GAME.random.seed) +
+              ", " + "%.2f" % time_elapsed + "s" +
+              " (" + "%.0f" % turns_per_sec + " turns/s)")
+
+def game_record(file_name, seed = None):
+
+    '''Plays a new game in a window, recording the input to file_name.
+
+    Args:
+        file_name (str): file the input is recorded to, see
+            obj_InputRecorder.
+        seed (int, optional): seed of the game, picked at random if not
+            included.
+
+    '''
+
+    global INPUT
+
+    game_initialize()
+
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 0x7FFFFFFF)
+
+    INPUT = obj_InputRecorder(INPUT, file_name, seed)
+
+    game_new(seed)
+
+    try:
+        game_main_loop()
+    finally:
+        INPUT.close()
+
+def game_replay(file_name, headless = False):
+
+    '''Plays back a game recorded by game_record as fast as it can.
+
+    A line summing the game up is printed once the replay ends.
+
+    Args:
+        file_name (str): file the input was recorded to.
+        headless (bool, optional): True to replay without a window.
+
+    '''
+
+    global INPUT
+
+    game_initialize(headless = headless)
+
+    INPUT = obj_InputReplay(file_name)
+
+    game_new(INPUT.seed)
+
+    time_start = time.time()
+    game_main_loop()
+    time_elapsed = time.time() - time_start
+
+    frames_per_sec = INPUT.frames_played / max(time_elapsed, 1e-6)
+
+    print("replay " + file_name +
+          ": " + (PLAYER.state or "STATUS_ALIVE") +
+          ", frames " + str(INPUT.frames_played) +
+          ", depth " + str(len(GAME.maps_previous) + 1) +
+          ", hp " + str(PLAYER.creature.current_hp) +
+          ", seed " + str(GAME.random.seed) +
+          ", " + "%.2f" % time_elapsed + "s" +
+          " (" + "%.0f" % frames_per_sec + " frames/s)")
+
+def game_script_load(file_name):
+
+    '''Reads a script of actions for obj_InputScript.
+
+    Blank lines and anything after a # are ignored.
+
+    '''
+
+    actions = []
+
+    with open(file_name, 'r') as file:
+        for line in file:
+            action = line.split("#")[0].strip()
+            if action:
+                actions.append(action)
+
+    return actions
+
+def game_script_random(num_actions, rng):
+
+    '''Returns a list of random actions, mostly moves.
+
+    Now and then the player picks up what is underfoot and tries the stairs,
+    so a random game goes further than the first level.
+
+    Args:
+        num_actions (int): length of the list.
+        rng (random.Random): generator the actions are rolled with.
+
+    '''
+
+    moves = ["up", "down", "left", "right"]
+
+    actions = []
+
+    for i in range(num_actions):
+        roll = rng.randint(1, 100)
+
+        if roll <= 5:
+            actions.append("g")
+        elif roll <= 8:
+            actions.append(">")
+        else:
+            actions.append(rng.choice(moves))
+
+    return actions
+
+def game_save_pack(obj, player_ref = True):
+
+    '''Pickles and compresses an object into a save file record.
+
+    Args:
+        obj (object): the object to store.
+        player_ref (bool, optional): if True, PLAYER is stored as a reference
+            to the PLAYER of the loaded game instead of a copy.  Every record
+            but the one holding PLAYER itself sets this.
+
+    Returns:
+        record (bytes): the compressed record.
+
+    '''
+
+    buffer = io.BytesIO()
+
+    pickler = pickle.Pickler(buffer, 2)
+    if player_ref:
+        pickler.persistent_id = game_save_persistent_id
+    pickler.dump(obj)
+
+    return zlib.compress(buffer.getvalue())
+
+def game_save_unpack(record):
+
+    '''Returns the object stored in a record made by game_save_pack.'''
+
+    unpickler = pickle.Unpickler(io.BytesIO(zlib.decompress(record)))
+    unpickler.persistent_load = game_save_persistent_load
+
+    return unpickler.load()
+
+def game_save_persistent_id(obj):
+
+    if obj is PLAYER:
+        return "PLAYER"
+
+    return None
+
+def game_save_persistent_load(persistent_id):
+
+    if persistent_id == "PLAYER":
+        return PLAYER
+
+    raise pickle.UnpicklingError("unknown persistent id " +
+                                 repr(persistent_id))
 
 def preferences_save():
-    with gzip.open('data\pref', 'wb') as file:
+    with gzip.open('data/pref', 'wb') as file:
         pickle.dump(PREFERENCES, file)
 
 def preferences_load():
     global PREFERENCES
 
-    with gzip.open('data\pref', 'rb') as file:
+    with gzip.open('data/pref', 'rb') as file:
         PREFERENCES = pickle.load(file)
 
 
@@ -3008,4 +6274,51 @@ def preferences_load():
 
 
 if __name__ == '__main__':
-    menu_main()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", action = "store_true",
+                        help = "play without a window, driven by a script")
+    parser.add_argument("--script",
+                        help = "file of actions for headless games, one per line")
+    parser.add_argument("--turns", type = int, default = 1000,
+                        help = "most actions played in a headless game")
+    parser.add_argument("--games", type = int, default = 1,
+                        help = "number of headless games to play")
+    parser.add_argument("--seed", type = int,
+                        help = "seed of the game, the same seed plays the "
+                               "same dungeon and fights")
+    parser.add_argument("--record",
+                        help = "start a new game right away, recording the "
+                               "input to this file")
+    parser.add_argument("--replay",
+                        help = "play back a file written by --record, with "
+                               "--headless to do so without a window")
+    parser.add_argument("--profile", choices = obj_Profiler.MODES,
+                        help = "profile the start of every game, writing "
+                               "the profile to data/")
+    parser.add_argument("--profile-frames", type = int,
+                        default = constants.PROFILE_FRAMES,
+                        help = "frames --profile captures")
+    parser.add_argument("--profile-turns", type = int,
+                        help = "capture this many turns of the player "
+                               "instead of a number of frames")
+    parser.add_argument("--no-audio", action = "store_true",
+                        help = "never load or play sound or music")
+    args = parser.parse_args()
+
+    if args.no_audio:
+        AUDIO_ENABLED = False
+
+    if args.profile and args.profile_turns:
+        PROFILE_ON_START = (args.profile, args.profile_turns, "turns")
+    elif args.profile:
+        PROFILE_ON_START = (args.profile, args.profile_frames, "frames")
+
+    if args.replay:
+        game_replay(args.replay, args.headless)
+    elif args.headless:
+        game_headless(args.script, args.games, args.turns, args.seed)
+    elif args.record:
+        game_record(args.record, args.seed)
+    else:
+        menu_main(args.seed)
@@ -0,0 +1,391 @@
+'''Times the hot paths of StartPythonGame.
+
+Every benchmark runs in headless mode, so no window is opened and drawing goes
+to pygame's dummy display.  Results are written as JSON, one entry per
+benchmark, map size and actor count, so runs can be compared across commits.
+
+Usage:
+    python benchmark.py --output results.json
+    python benchmark.py --compare results.json
+
+'''
+
+# modules
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import sys
+import timeit
+
+import numpy
+import pygame
+
+# game files
+import constants
+import StartPythonGame as game
+
+# the map size the room count in constants.py was chosen for
+DEFAULT_MAP_AREA = constants.MAP_WIDTH * constants.MAP_HEIGHT
+DEFAULT_NUM_ROOMS = constants.MAP_MAX_NUM_ROOMS
+
+# every world is generated from this seed, set with --seed
+SEED = 1
+
+
+
+def bench_time(func, repeat, number = 1):
+
+    '''Times a function the way timeit.repeat does.
+
+    Args:
+        func (function): called with no arguments.
+        repeat (int): number of samples taken.
+        number (int, optional): calls to func per sample.
+
+    Returns:
+        result (dict): min, median and mean seconds of a single call.
+
+    '''
+
+    samples = timeit.repeat(func, repeat = repeat, number = number)
+    samples = sorted(sample / number for sample in samples)
+
+    return {"min": samples[0],
+            "median": samples[len(samples) // 2],
+            "mean": sum(samples) / len(samples),
+            "repeat": repeat,
+            "number": number}
+
+def bench_world(width, height):
+
+    '''Starts a new headless game on a map of the given size.
+
+    The room count grows with the area of the map so large maps are not mostly
+    solid rock.  The player can not die, so AI turns can be timed for as long
+    as needed.  The game is seeded with SEED, so every run times the same
+    dungeon and the same fights.
+
+    '''
+
+    constants.MAP_WIDTH = width
+    constants.MAP_HEIGHT = height
+    constants.MAP_MAX_NUM_ROOMS = max(DEFAULT_NUM_ROOMS,
+        DEFAULT_NUM_ROOMS * width * height // DEFAULT_MAP_AREA)
+
+    game.game_initialize(headless = True)
+    game.game_new(SEED)
+
+    # the level below would otherwise be generating while timings run
+    game.LEVEL_PREGEN.discard()
+
+    game.PLAYER.creature.max_hp = game.PLAYER.creature.current_hp = 10 ** 9
+
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+
+def bench_spawn_monsters(num_monsters):
+
+    '''Fills the open tiles nearest the player with monsters.
+
+    Crowding the player is the worst case for the AI, since every monster
+    within the FOV takes a turn.
+
+    Returns:
+        num_spawned (int): monsters added, less than num_monsters if the map
+            runs out of open tiles.
+
+    '''
+
+    current_map = game.GAME.current_map
+
+    open_x, open_y = numpy.nonzero(~current_map.block_path)
+    distance = numpy.maximum(abs(open_x - game.PLAYER.x),
+                             abs(open_y - game.PLAYER.y))
+
+    num_spawned = 0
+
+    for i in numpy.argsort(distance, kind = "mergesort"):
+        if num_spawned == num_monsters:
+            break
+
+        x, y = int(open_x[i]), int(open_y[i])
+
+        if game.map_check_for_creature(x, y):
+            continue
+
+        game.GAME.add_object(game.gen_snake_anaconda((x, y)))
+        num_spawned += 1
+
+    return num_spawned
+
+def bench_map(width, height, repeat):
+
+    '''Map creation, FOV and drawing on one map size.'''
+
+    bench_world(width, height)
+
+    current_map = game.GAME.current_map
+
+    def calculate_fov():
+        game.FOV_CALCULATE = True
+        game.map_calculate_fov()
+
+    def draw_map():
+        game.CAMERA.update()
+        game.draw_map(current_map)
+
+    def draw_map_cold():
+        current_map.layer = None
+        game.draw_map(current_map)
+
+    # every map made is freed again, as a level thrown away would be
+    return [("map_create", bench_time(lambda: game.map_delete(
+                game.map_create()[0]), repeat)),
+            ("gen_level", bench_time(lambda: game.map_delete(
+                game.gen_level(2, 1)[0]), repeat)),
+            ("map_make_fov", bench_time(lambda: game.libtcod.map_delete(
+                game.map_make_fov(current_map)), repeat)),
+            ("map_calculate_fov", bench_time(calculate_fov, repeat, 10)),
+            ("draw_map", bench_time(draw_map, repeat, 10)),
+            ("draw_map_cold", bench_time(draw_map_cold, repeat)),
+            ("draw_game", bench_time(game.draw_game, repeat, 10))]
+
+def bench_actors(width, height, num_actors, repeat):
+
+    '''Creature lookups and AI turns with num_actors monsters on the map.'''
+
+    bench_world(width, height)
+
+    num_spawned = bench_spawn_monsters(num_actors)
+
+    rng = random.Random(SEED)
+
+    lookups = [(rng.randint(0, width - 1), rng.randint(0, height - 1))
+               for i in range(1000)]
+
+    def check_for_creature():
+        for x, y in lookups:
+            game.map_check_for_creature(x, y)
+
+    results = [("map_check_for_creature",
+                bench_time(check_for_creature, repeat)),
+               ("ai_turn", bench_ai_turn(repeat))]
+
+    # the same crowd again, every monster taking its own turn
+    batch = constants.AI_BATCH
+    constants.AI_BATCH = False
+
+    try:
+        bench_world(width, height)
+        bench_spawn_monsters(num_actors)
+
+        results.append(("ai_turn_unbatched", bench_ai_turn(repeat)))
+    finally:
+        constants.AI_BATCH = batch
+
+    # lookups are timed 1000 at a time, report a single call
+    for key in ("min", "median", "mean"):
+        results[0][1][key] /= len(lookups)
+
+    # results are keyed by the count asked for, small maps may hold fewer
+    for name, result in results:
+        result["actors"] = num_actors
+        result["actors_spawned"] = num_spawned
+
+    return results
+
+def bench_crowd(width, height, num_actors, repeat):
+
+    '''The first turn of num_actors monsters that all see the player.
+
+    The walls are knocked down and the FOV has no radius, so the whole crowd
+    acts at once.  ai_crowd batches every crowd, whatever its size, and
+    ai_crowd_unbatched batches none, so the actor count where the two cross is
+    the AI_BATCH_MIN_ACTORS to use.  The first turn wakes the crowd, so every
+    sample is taken on a new world.
+
+    '''
+
+    batch = constants.AI_BATCH
+    min_actors = constants.AI_BATCH_MIN_ACTORS
+    torch_radius = constants.TORCH_RADIUS
+
+    results = []
+
+    try:
+        constants.TORCH_RADIUS = 0
+        constants.AI_BATCH_MIN_ACTORS = 1
+
+        for name, batched in (("ai_crowd", True),
+                              ("ai_crowd_unbatched", False)):
+            constants.AI_BATCH = batched
+
+            samples = []
+
+            for i in range(repeat):
+                bench_world(width, height)
+
+                current_map = game.GAME.current_map
+                current_map.block_path[1:-1, 1:-1] = False
+                current_map.layer = None
+
+                game.map_delete(current_map)
+                game.map_load_fov(current_map)
+                game.map_calculate_fov()
+
+                num_spawned = bench_spawn_monsters(num_actors)
+
+                start = timeit.default_timer()
+                game.GAME.take_turns(game.PLAYER.creature.action_delay)
+                samples.append(timeit.default_timer() - start)
+
+            samples.sort()
+
+            results.append((name, {"min": samples[0],
+                                   "median": samples[len(samples) // 2],
+                                   "mean": sum(samples) / len(samples),
+                                   "repeat": repeat,
+                                   "number": 1,
+                                   "actors": num_actors,
+                                   "actors_spawned": num_spawned}))
+    finally:
+        constants.AI_BATCH = batch
+        constants.AI_BATCH_MIN_ACTORS = min_actors
+        constants.TORCH_RADIUS = torch_radius
+
+    return results
+
+def bench_ai_turn(repeat):
+
+    def ai_turn():
+        game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+    return bench_time(ai_turn, repeat)
+
+def bench_run(sizes, actor_counts, repeat):
+
+    results = []
+
+    for width, height in sizes:
+
+        size = str(width) + "x" + str(height)
+
+        timings = bench_map(width, height, repeat)
+        for num_actors in actor_counts:
+            timings += bench_actors(width, height, num_actors, repeat)
+            timings += bench_crowd(width, height, num_actors, repeat)
+
+        for name, result in timings:
+            result["name"] = name
+            result["size"] = size
+            result.setdefault("actors", None)
+            results.append(result)
+
+            sys.stderr.write("%-24s %-9s %-6s %10.3f ms\n" % (name, size,
+                result["actors"] if result["actors"] is not None else "",
+                result["min"] * 1000))
+
+    return results
+
+def bench_metadata(args):
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+            stderr = subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"date": datetime.datetime.now().isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy.__version__,
+            "pygame": pygame.version.ver,
+            "repeat": args.repeat,
+            "seed": args.seed}
+
+def bench_compare(results, baseline_file, threshold):
+
+    '''Prints how much slower or faster each benchmark is than a baseline.
+
+    Returns:
+        regressed (bool): True if any benchmark got slower than threshold
+            times the baseline.
+
+    '''
+
+    with open(baseline_file, 'r') as file:
+        baseline = json.load(file)
+
+    baseline_min = dict(((result["name"], result["size"], result["actors"]),
+                         result["min"]) for result in baseline["results"])
+
+    regressed = False
+
+    for result in results:
+        key = (result["name"], result["size"], result["actors"])
+
+        if key not in baseline_min:
+            continue
+
+        ratio = result["min"] / max(baseline_min[key], 1e-12)
+        flag = ""
+
+        if ratio > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+
+        sys.stderr.write("%-24s %-9s %-6s %8.2fx%s\n" % (key[0], key[1],
+            key[2] if key[2] is not None else "", ratio, flag))
+
+    return regressed
+
+def bench_parse_size(text):
+
+    width, height = text.lower().split("x")
+
+    return int(width), int(height)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs = "+", type = bench_parse_size,
+                        default = [(20, 20), (50, 50), (100, 100)],
+                        help = "map sizes as WIDTHxHEIGHT")
+    parser.add_argument("--actors", nargs = "+", type = int,
+                        default = [10, 100, 500],
+                        help = "monster counts for the actor benchmarks")
+    parser.add_argument("--repeat", type = int, default = 5,
+                        help = "samples taken per benchmark")
+    parser.add_argument("--output",
+                        help = "file the JSON results are written to, "
+                               "stdout if not given")
+    parser.add_argument("--compare",
+                        help = "JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type = float, default = 1.25,
+                        help = "slowdown against --compare that counts as "
+                               "a regression")
+    parser.add_argument("--seed", type = int, default = SEED,
+                        help = "seed the worlds are generated from")
+    args = parser.parse_args()
+
+    SEED = args.seed
+
+    results = bench_run(args.sizes, args.actors, args.repeat)
+
+    report = {"meta": bench_metadata(args), "results": results}
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent = 2, sort_keys = True)
+    else:
+        json.dump(report, sys.stdout, indent = 2, sort_keys = True)
+        sys.stdout.write("\n")
+
+    if args.compare and bench_compare(results, args.compare, args.threshold):
+        sys.exit(1)
@@ -41,15 +41,54 @@ FOV_ALGO = libtcod.FOV_BASIC  # Algorithm for FOV Calculation
 FOV_LIGHT_WALLS = True        # Does the FOV shine on the walls?
 TORCH_RADIUS = 10             # Sight radius for FOV
 
+# TURNS
+SPEED_NORMAL = 100            # Speed of a creature of normal speed
+TURN_ACTION_COST = 100        # Game time a turn takes at normal speed
+
+# AI
+CHASE_FIELD_RADIUS = 20       # How far monsters find their way to the player
+PATH_RETARGET_DISTANCE = 3    # How far a goal moves before a route is redone
+NOISE_ATTACK = 6              # How far the sound of an attack wakes monsters
+NOISE_ALERT_TURNS = 10        # Turns a monster hunts out of sight after a noise
+AI_BATCH = True               # Let obj_BatchAI take crowds' turns, moves first
+AI_BATCH_MIN_ACTORS = 128     # Fewest monsters acting at once to be a crowd
+
 # MESSAGE DEFAULTS
 NUM_MESSAGES = 4
 
+# TEXT CACHE
+TEXT_CACHE_SIZE = 256         # Rendered text surfaces kept between frames
+
+# FRAME TIMING
+FRAME_TIMER_SAMPLES = 600     # Frames the phase percentiles cover
+KEY_FRAME_OVERLAY = pygame.K_F3  # Shows or hides the phase timings
+KEY_FRAME_DUMP = pygame.K_F4     # Writes the phase timings to a file
+
+# PROFILING
+PROFILE_FRAMES = 300          # Frames a profile started by a key captures
+PROFILE_SAMPLE_INTERVAL = 0.001  # Seconds between samples of the stack
+KEY_PROFILE = pygame.K_F5     # Captures a cProfile profile
+KEY_PROFILE_SAMPLE = pygame.K_F6  # Captures a sampled profile
+
+# SAVE FILE
+SAVE_MAGIC = b"RGSAVE"        # First bytes of a save file
+SAVE_VERSION = 1              # Raise when the save format changes
+
+# REPLAY FILE
+REPLAY_MAGIC = "RGREPLAY"     # Format named in the header of a replay
+REPLAY_VERSION = 1            # Raise when the replay format changes
+
+# SPRITE ATLAS
+ATLAS_FILE = "data/cache/sprites.png"  # Every sprite, scaled and packed
+ATLAS_INDEX_FILE = "data/cache/sprites.json"  # Where each sprite is packed
+ATLAS_VERSION = 1             # Raise when the atlas layout changes
+
 # DEFAULT FONTS
-FONT_TITLE_SCREEN = pygame.font.Font('data\joystix.ttf', 26)
-FONT_DEBUG_MESSAGE = pygame.font.Font('data\joystix.ttf', 16)
-FONT_MESSAGE_TEXT = pygame.font.Font('data\joystix.ttf', 12)
-FONT_CURSOR_TEXT = pygame.font.Font('data\joystix.ttf', CELL_HEIGHT)
-FONT_TITLE_TEXT = pygame.font.Font('data\serpents.ttf', 40)
+FONT_TITLE_SCREEN = pygame.font.Font('data/joystix.ttf', 26)
+FONT_DEBUG_MESSAGE = pygame.font.Font('data/joystix.ttf', 16)
+FONT_MESSAGE_TEXT = pygame.font.Font('data/joystix.ttf', 12)
+FONT_CURSOR_TEXT = pygame.font.Font('data/joystix.ttf', CELL_HEIGHT)
+FONT_TITLE_TEXT = pygame.font.Font('data/serpents.ttf', 40)
 
 # DEPTHS
 DEPTH_PLAYER = -100
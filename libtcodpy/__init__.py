@@ -2097,6 +2097,108 @@ _lib.TCOD_map_get_nb_cells.argtypes=[c_void_p ]
 def map_get_nb_cells(map):
     return TCOD_map_get_nb_cells(map)
 
+# bulk map access
+# The cells of a map are read and written directly through the map struct.
+# Older libtcod builds pack a cell into one byte of bit fields
+# (transparent:1, walkable:1, fov:1), newer ones use three bools, so the
+# layout is probed once on a small map.  If neither layout matches, the
+# functions below fall back to one call per cell.
+class _CMap(Structure):
+    _fields_=[('width', c_int),
+              ('height', c_int),
+              ('nbcells', c_int),
+              ('cells', c_void_p),
+              ]
+
+_MAP_CELLS_BITS = 1
+_MAP_CELLS_BYTES = 3
+_map_cell_layout = None
+
+def _map_probe_cell_layout():
+    global _map_cell_layout
+    if _map_cell_layout is None:
+        _map_cell_layout = False
+        m = map_new(4, 3)
+        try:
+            cmap = cast(c_void_p(m), POINTER(_CMap)).contents
+            if (cmap.width, cmap.height, cmap.nbcells) == (4, 3, 12):
+                map_clear(m, False, False)
+                map_set_properties(m, 1, 0, True, False)
+                map_set_properties(m, 2, 0, False, True)
+                map_set_in_fov(m, 3, 0, True)
+                raw = bytearray(string_at(cmap.cells, 12))
+                if raw == bytearray([0, 1, 2, 4, 0, 0, 0, 0, 0, 0, 0, 0]):
+                    _map_cell_layout = _MAP_CELLS_BITS
+                elif raw == bytearray([0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1]):
+                    _map_cell_layout = _MAP_CELLS_BYTES
+        finally:
+            map_delete(m)
+    return _map_cell_layout
+
+def _map_flat(values, nbcells):
+    # row order (x + y * width), a 2D numpy array is indexed [y, x]
+    if numpy_available and isinstance(values, numpy.ndarray):
+        values = numpy.ascontiguousarray(values, dtype=numpy.bool_).ravel()
+    if len(values) != nbcells:
+        raise TypeError('Expected %d cells, got %d.' % (nbcells, len(values)))
+    return values
+
+# set the transparency and walkability of every cell in one go
+def map_set_properties_array(m, transparent, walkable):
+    cmap = cast(c_void_p(m), POINTER(_CMap)).contents
+    w, nbcells = cmap.width, cmap.nbcells
+    transparent = _map_flat(transparent, nbcells)
+    walkable = _map_flat(walkable, nbcells)
+    layout = _map_probe_cell_layout()
+    if not layout:
+        for i in range(nbcells):
+            map_set_properties(m, i % w, i // w, transparent[i], walkable[i])
+        return
+    if numpy_available:
+        trans = numpy.asarray(transparent, dtype=numpy.uint8)
+        walk = numpy.asarray(walkable, dtype=numpy.uint8)
+        if layout == _MAP_CELLS_BITS:
+            cells = trans | (walk << 1)
+        else:
+            cells = numpy.zeros((nbcells, 3), dtype=numpy.uint8)
+            cells[:, 0] = trans
+            cells[:, 1] = walk
+        cells = cells.tobytes()
+    else:
+        cells = bytearray(nbcells * layout)
+        for i in range(nbcells):
+            if layout == _MAP_CELLS_BITS:
+                cells[i] = (1 if transparent[i] else 0) | (2 if walkable[i] else 0)
+            else:
+                cells[i * 3] = 1 if transparent[i] else 0
+                cells[i * 3 + 1] = 1 if walkable[i] else 0
+        cells = bytes(cells)
+    memmove(cmap.cells, cells, len(cells))
+
+# the fov flag of every cell, as a numpy bool array indexed [y, x] if numpy is
+# available, otherwise as a flat list in row order
+def map_get_fov_array(m):
+    cmap = cast(c_void_p(m), POINTER(_CMap)).contents
+    w, h, nbcells = cmap.width, cmap.height, cmap.nbcells
+    layout = _map_probe_cell_layout()
+    if not layout:
+        fov = [map_is_in_fov(m, i % w, i // w) for i in range(nbcells)]
+        if numpy_available:
+            return numpy.array(fov, dtype=numpy.bool_).reshape(h, w)
+        return fov
+    raw = string_at(cmap.cells, nbcells * layout)
+    if numpy_available:
+        cells = numpy.frombuffer(raw, dtype=numpy.uint8)
+        if layout == _MAP_CELLS_BITS:
+            fov = (cells & 4).astype(numpy.bool_)
+        else:
+            fov = cells[2::3].astype(numpy.bool_)
+        return fov.reshape(h, w)
+    cells = bytearray(raw)
+    if layout == _MAP_CELLS_BITS:
+        return [bool(c & 4) for c in cells]
+    return [bool(c) for c in cells[2::3]]
+
 ############################
 # pathfinding module
 ############################
@@ -0,0 +1,42 @@
+'''Shared setup of the tests.
+
+The game reads its data/ files relative to the repository root, so the tests
+run from there, and the game is started once in headless mode.
+
+'''
+
+# modules
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# constants loads its fonts from data/ when imported
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+# game files
+import StartPythonGame as game
+
+
+
+@pytest.fixture(scope = "session")
+def headless():
+
+    '''The game module, initialized without a window.'''
+
+    game.game_initialize(headless = True)
+
+    return game
+
+@pytest.fixture
+def new_game(headless):
+
+    '''Starts a new game from seed 1, without generating the level below.'''
+
+    headless.game_new(1)
+    headless.LEVEL_PREGEN.discard()
+
+    return headless
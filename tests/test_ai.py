@@ -0,0 +1,177 @@
+'''Tests of the monster ai, taken one monster at a time and by obj_BatchAI.'''
+
+# modules
+import numpy
+import pytest
+
+# game files
+import constants
+from conftest import game
+
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_flee_never_nears_player(new_game, monkeypatch, batch):
+
+    monkeypatch.setattr(constants, "AI_BATCH", batch)
+    monkeypatch.setattr(constants, "AI_BATCH_MIN_ACTORS", 1)
+
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+
+    # mice on every other tile the player can see, on all sides of it
+    open_x, open_y = numpy.nonzero(~game.GAME.current_map.block_path &
+                                   game.FOV_MASK)
+
+    mice = []
+
+    for x, y in zip(open_x.tolist()[::2], open_y.tolist()[::2]):
+        if not game.map_check_for_creature(x, y):
+            mice.append(game.gen_mouse((x, y)))
+            game.GAME.add_object(mice[-1])
+
+    assert len(mice) > 4
+
+    def distance(mouse):
+        return (mouse.x - game.PLAYER.x) ** 2 + (mouse.y - game.PLAYER.y) ** 2
+
+    for turn in range(10):
+        before = [distance(mouse) for mouse in mice]
+
+        game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+        after = [distance(mouse) for mouse in mice]
+
+        assert all(a >= b for a, b in zip(after, before))
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_noise_wakes_monsters(new_game, monkeypatch, batch):
+
+    monkeypatch.setattr(constants, "AI_BATCH", batch)
+    monkeypatch.setattr(constants, "AI_BATCH_MIN_ACTORS", 1)
+
+    scheduler = game.GAME.scheduler
+
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+    game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+    chasers = [obj for obj in game.GAME.current_objects
+               if obj.ai.__class__ is game.ai_Chase]
+
+    # no fight in sight to make noises of its own
+    for obj in chasers:
+        if game.FOV_MASK[obj.x, obj.y]:
+            game.GAME.remove_object(obj)
+
+    hidden = [obj for obj in chasers if not game.FOV_MASK[obj.x, obj.y]]
+
+    assert hidden
+    assert all(id(obj) in scheduler.dormant for obj in hidden)
+
+    start = [(obj.x, obj.y) for obj in hidden]
+
+    current_map = game.GAME.current_map
+    game.map_make_noise((game.PLAYER.x, game.PLAYER.y),
+                        max(current_map.width, current_map.height))
+
+    game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+    # every monster heard it and came looking for the player
+    for obj, coords in zip(hidden, start):
+        assert (obj.x, obj.y) != coords
+        assert id(obj) not in scheduler.dormant
+
+    # and gives up once it has been out of sight long enough
+    for turn in range(constants.NOISE_ALERT_TURNS):
+        game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+    for obj in hidden:
+        assert (game.FOV_MASK[obj.x, obj.y] or
+                id(obj) in scheduler.dormant)
+
+def test_new_wall_reroutes(new_game):
+
+    current_map = game.GAME.current_map
+
+    start_x, start_y = game.PLAYER.x, game.PLAYER.y
+    goal_x, goal_y = game.map_find_farthest_room((start_x, start_y))
+
+    path = game.obj_PathCache()
+    path.next_step(current_map, start_x, start_y, goal_x, goal_y)
+
+    assert path.recomputes == 1
+    assert len(path.steps) > 4
+
+    # a change away from the route keeps it
+    game.map_tile_set_block(current_map, 0, 0, True)
+    path.next_step(current_map, start_x, start_y, goal_x, goal_y)
+
+    assert path.recomputes == 1
+
+    # a wall across it has the route found again
+    wall_x, wall_y = path.steps[len(path.steps) // 2]
+    game.map_tile_set_block(current_map, wall_x, wall_y, True)
+    path.next_step(current_map, start_x, start_y, goal_x, goal_y)
+
+    assert path.recomputes == 2
+    assert (wall_x, wall_y) not in path.steps
+
+    # and so does the distance field
+    field = game.obj_DistanceField(constants.CHASE_FIELD_RADIUS)
+    field.update(current_map, goal_x, goal_y)
+
+    assert field.get(wall_x, wall_y) == game.obj_DistanceField.UNREACHED
+
+    game.map_tile_set_block(current_map, wall_x, wall_y, False)
+    field.update(current_map, goal_x, goal_y)
+
+    assert field.get(wall_x, wall_y) != game.obj_DistanceField.UNREACHED
+
+def crowd_turns(monkeypatch, batch):
+
+    '''Plays 3 turns of chasers spread over an open map, returns where
+    everything ended up and the messages of the fights.'''
+
+    monkeypatch.setattr(constants, "AI_BATCH", batch)
+    monkeypatch.setattr(constants, "TORCH_RADIUS", 0)
+    monkeypatch.setattr(constants, "MAP_WIDTH", 40)
+    monkeypatch.setattr(constants, "MAP_HEIGHT", 40)
+
+    game.game_new(1)
+    game.LEVEL_PREGEN.discard()
+
+    game.PLAYER.creature.max_hp = game.PLAYER.creature.current_hp = 10 ** 9
+
+    current_map = game.GAME.current_map
+
+    for obj in list(game.GAME.current_objects):
+        if obj is not game.PLAYER:
+            game.GAME.remove_object(obj)
+
+    for x in range(1, current_map.width - 1):
+        for y in range(1, current_map.height - 1):
+            game.map_tile_set_block(current_map, x, y, False)
+
+    # far enough apart that no two want the same tile
+    for x in range(2, current_map.width - 2, 4):
+        for y in range(2, current_map.height - 2, 4):
+            if max(abs(x - game.PLAYER.x), abs(y - game.PLAYER.y)) > 1:
+                game.GAME.add_object(game.gen_snake_anaconda((x, y)))
+
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+
+    for turn in range(3):
+        game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+    return ([(obj.name_object, obj.x, obj.y)
+             for obj in game.GAME.current_objects],
+            game.PLAYER.creature.current_hp,
+            list(game.GAME.message_history))
+
+def test_batch_matches_single_turns(headless, monkeypatch):
+
+    monkeypatch.setattr(constants, "AI_BATCH_MIN_ACTORS", 1)
+
+    assert crowd_turns(monkeypatch, True) == crowd_turns(monkeypatch, False)
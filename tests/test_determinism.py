@@ -0,0 +1,70 @@
+'''Tests that a game is decided by its seed and its input alone.'''
+
+# modules
+import random
+
+# game files
+from conftest import game
+
+
+
+def game_state():
+
+    return {"state": game.PLAYER.state,
+            "player": (game.PLAYER.x, game.PLAYER.y),
+            "hp": game.PLAYER.creature.current_hp,
+            "depth": len(game.GAME.maps_previous) + 1,
+            "time": game.GAME.time,
+            "objects": sorted((obj.name_object, obj.x, obj.y)
+                              for obj in game.GAME.current_objects),
+            "walls": game.GAME.current_map.block_path.tolist(),
+            "messages": list(game.GAME.message_history)}
+
+def play(seed, actions):
+
+    '''Plays a new game from seed through actions, returns its end state.'''
+
+    game.INPUT = game.obj_InputScript(actions)
+
+    game.game_new(seed)
+    game.game_main_loop()
+
+    game.LEVEL_PREGEN.discard()
+
+    return game_state()
+
+def test_seeded_game_repeats(headless, monkeypatch):
+
+    monkeypatch.setattr(game, "INPUT", game.INPUT)
+
+    actions = game.game_script_random(500, random.Random(3))
+
+    first = play(77, actions)
+
+    assert play(77, actions) == first
+    assert play(78, actions) != first
+
+def test_recording_replays(headless, monkeypatch, tmpdir):
+
+    monkeypatch.setattr(game, "INPUT", game.INPUT)
+
+    file_name = str(tmpdir.join("session.gz"))
+
+    actions = game.game_script_random(500, random.Random(5))
+
+    game.INPUT = game.obj_InputRecorder(game.obj_InputScript(actions),
+                                        file_name, 77)
+
+    game.game_new(77)
+
+    try:
+        game.game_main_loop()
+    finally:
+        game.INPUT.close()
+
+    recorded = game_state()
+
+    game.game_replay(file_name, headless = True)
+    game.LEVEL_PREGEN.discard()
+
+    assert game_state() == recorded
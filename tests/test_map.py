@@ -0,0 +1,134 @@
+'''Tests of the maps of the levels and their libtcod FOV maps.'''
+
+# modules
+import pytest
+
+# game files
+import constants
+from conftest import game
+
+
+
+def test_new_game_frees_levels(new_game):
+
+    old_map = game.GAME.current_map
+
+    goal_x, goal_y = game.GAME.current_rooms[-1].center
+    game.map_find_path(old_map, game.PLAYER.x, game.PLAYER.y, goal_x, goal_y)
+
+    assert old_map.fov_map is not None
+    assert old_map.pathfinder is not None
+
+    game.game_new(2)
+    game.LEVEL_PREGEN.discard()
+
+    assert old_map.fov_map is None
+    assert old_map.pathfinder is None
+    assert game.FOV_MAP is game.GAME.current_map.fov_map
+
+def test_discarded_level_is_freed(new_game, monkeypatch):
+
+    levels = []
+
+    def gen_level(current_level, seed):
+        levels.append(game_gen_level(current_level, seed))
+        return levels[-1]
+
+    game_gen_level = game.gen_level
+    monkeypatch.setattr(game, "gen_level", gen_level)
+
+    game.LEVEL_PREGEN.start(2, 1)
+    game.LEVEL_PREGEN.discard()
+
+    assert levels[0][0].fov_map is None
+
+@pytest.mark.parametrize("size", [(constants.MAP_WIDTH, constants.MAP_HEIGHT),
+                                  (37, 23)])
+def test_fov_arrays_match_tiles(headless, monkeypatch, size):
+
+    monkeypatch.setattr(constants, "MAP_WIDTH", size[0])
+    monkeypatch.setattr(constants, "MAP_HEIGHT", size[1])
+
+    game.game_new(1)
+    game.LEVEL_PREGEN.discard()
+
+    current_map = game.GAME.current_map
+    assert current_map.block_path.shape == size
+
+    fov_map = game.FOV_MAP
+
+    for x in range(current_map.width):
+        for y in range(current_map.height):
+            is_open = not current_map.block_path[x, y]
+
+            assert game.libtcod.map_is_transparent(fov_map, x, y) == is_open
+            assert game.libtcod.map_is_walkable(fov_map, x, y) == is_open
+
+    # the FOV from the middle of every room
+    for room in game.GAME.current_rooms:
+        game.PLAYER.x, game.PLAYER.y = room.center
+
+        game.FOV_CALCULATE = True
+        game.map_calculate_fov()
+
+        assert game.FOV_MASK.any()
+
+        for x in range(current_map.width):
+            for y in range(current_map.height):
+                assert (game.FOV_MASK[x, y] ==
+                        game.libtcod.map_is_in_fov(fov_map, x, y))
+
+def test_tile_set_block(new_game):
+
+    current_map = game.GAME.current_map
+
+    game.draw_map(current_map)
+    layer = current_map.layer
+
+    # a floor tile of the player's room, walled up through struc_Tile
+    x, y = game.PLAYER.x + 1, game.PLAYER.y
+    assert not current_map.block_path[x, y]
+
+    version = current_map.version
+    game.FOV_CALCULATE = False
+
+    current_map[x][y].block_path = True
+
+    assert current_map.block_path[x, y]
+    assert current_map.version > version
+    assert game.FOV_CALCULATE
+
+    assert not game.libtcod.map_is_walkable(current_map.fov_map, x, y)
+    assert not game.libtcod.map_is_transparent(current_map.fov_map, x, y)
+
+    tile_rect = game.pygame.Rect(x * constants.CELL_WIDTH,
+                                 y * constants.CELL_HEIGHT,
+                                 constants.CELL_WIDTH, constants.CELL_HEIGHT)
+
+    def pixels(surface):
+        return game.pygame.image.tostring(surface, "RGB")
+
+    assert (pixels(layer.surface_visible.subsurface(tile_rect)) ==
+            pixels(game.ASSETS.S_WALL))
+
+    game.map_tile_set_block(current_map, x, y, False)
+
+    assert game.libtcod.map_is_walkable(current_map.fov_map, x, y)
+    assert (pixels(layer.surface_visible.subsurface(tile_rect)) ==
+            pixels(game.ASSETS.S_FLOOR))
+
+def test_pregen_error_keeps_traceback(new_game, monkeypatch):
+
+    def broken_gen_level(current_level, seed):
+        raise ValueError("level " + str(current_level))
+
+    monkeypatch.setattr(game, "gen_level", broken_gen_level)
+
+    game.LEVEL_PREGEN.start(2, 1)
+
+    with pytest.raises(ValueError) as error:
+        game.LEVEL_PREGEN.take(2, 1)
+
+    # the traceback leads to where the thread failed
+    assert error.value.args == ("level 2",)
+    assert error.traceback[-1].name == "broken_gen_level"
@@ -0,0 +1,53 @@
+'''Tests of the actors of the current level and obj_ObjectIndex.'''
+
+# game files
+import constants
+from conftest import game
+
+
+
+def check_draw_order():
+
+    draw_order = game.GAME.object_index.draw_order
+
+    objects = game.GAME.current_objects
+
+    assert sorted(map(id, draw_order)) == sorted(map(id, objects))
+
+    depths = [obj.depth for obj in draw_order]
+    assert depths == sorted(depths, reverse = True)
+
+def test_draw_order_follows_depth(new_game):
+
+    draw_order = game.GAME.object_index.draw_order
+
+    check_draw_order()
+
+    coords = game.GAME.current_rooms[-1].center
+    assert not game.map_check_for_creature(*coords)
+
+    snake = game.gen_snake_anaconda(coords)
+    game.GAME.add_object(snake)
+
+    check_draw_order()
+    assert draw_order.index(snake) < draw_order.index(game.PLAYER)
+
+    # the corpse goes under everything but the background, after the
+    # corpses already there
+    game.death_snake(snake)
+
+    check_draw_order()
+
+    corpses = [obj for obj in draw_order
+               if obj.depth == constants.DEPTH_CORPSE]
+    assert corpses[-1] is snake
+
+    snake.depth = constants.DEPTH_PLAYER - 1
+
+    check_draw_order()
+    assert draw_order[-1] is snake
+
+    game.GAME.remove_object(snake)
+
+    check_draw_order()
+    assert snake not in draw_order
@@ -0,0 +1,106 @@
+'''Tests of game_save and game_load.'''
+
+# modules
+import os
+import shutil
+
+# game files
+from conftest import ROOT, game
+
+# a save made with the game as of the baseline commit, a gzip pickle of
+# [GAME, PLAYER] from when the map was a list of tile columns.  The player
+# had gone down one level and equipped a sword.
+BASELINE_SAVE = os.path.join(ROOT, "tests", "data", "savegame_baseline")
+
+
+
+def level_state():
+
+    return {"player": (game.PLAYER.x, game.PLAYER.y),
+            "hp": game.PLAYER.creature.current_hp,
+            "power": game.PLAYER.creature.power,
+            "objects": sorted((obj.name_object, obj.x, obj.y)
+                              for obj in game.GAME.current_objects),
+            "walls": game.GAME.current_map.block_path.tolist(),
+            "explored": game.GAME.current_map.explored.tolist(),
+            "time": game.GAME.time,
+            "messages": list(game.GAME.message_history)}
+
+def test_save_and_load(new_game, tmpdir):
+
+    file_name = str(tmpdir.join("savegame"))
+
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+    game.GAME.take_turns(game.PLAYER.creature.action_delay)
+
+    first_level = level_state()
+
+    game.GAME.transition_next()
+    game.LEVEL_PREGEN.discard()
+
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+
+    second_level = level_state()
+
+    game.game_save(file_name)
+    game.game_load(file_name)
+    game.LEVEL_PREGEN.discard()
+
+    assert level_state() == second_level
+    assert len(game.GAME.maps_previous) == 1
+
+    # the level above is only read from the file on the way back up
+    assert isinstance(game.GAME.maps_previous[0], game.struc_SaveRecord)
+
+    game.GAME.transition_previous()
+
+    first_level.pop("player")
+    first_level.pop("messages")
+    reloaded = level_state()
+    reloaded.pop("player")
+    reloaded.pop("messages")
+
+    assert reloaded["objects"] == first_level["objects"]
+    assert reloaded["walls"] == first_level["walls"]
+    assert reloaded["explored"] == first_level["explored"]
+
+def test_load_baseline_save(headless, tmpdir):
+
+    file_name = str(tmpdir.join("savegame"))
+    shutil.copy(BASELINE_SAVE, file_name)
+
+    game.game_load(file_name)
+    game.LEVEL_PREGEN.discard()
+
+    assert (game.PLAYER.x, game.PLAYER.y) == (15, 6)
+    assert game.PLAYER.creature.name_instance == "Paul"
+    assert game.PLAYER.creature.current_hp == 47
+    assert game.PLAYER.creature.power == 9
+    assert len(game.GAME.current_objects) == 11
+    assert len(game.GAME.message_history) == 2
+
+    assert isinstance(game.GAME.current_map, game.struc_TileGrid)
+    assert game.GAME.current_map.block_path.shape == (20, 20)
+    assert game.GAME.current_map.block_path.sum() == 319
+    assert game.GAME.current_map.explored.sum() == 46
+
+    # actors are indexed by where they were saved
+    assert game.PLAYER in game.GAME.object_index.objects_at(15, 6)
+
+    # the game plays on, and saves in the current format
+    game.FOV_CALCULATE = True
+    game.map_calculate_fov()
+    game.GAME.take_turns(game.PLAYER.creature.action_delay * 10)
+
+    game.GAME.transition_previous()
+
+    assert game.GAME.current_map.block_path.sum() == 319
+    assert game.GAME.current_map.explored.sum() == 69
+
+    game.game_save(file_name)
+    game.game_load(file_name)
+    game.LEVEL_PREGEN.discard()
+
+    assert game.GAME.current_map.explored.sum() >= 69